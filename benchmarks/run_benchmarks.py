@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""benchmark harness for the hot paths of cwkWritingToolKit, run outside Sublime Text
+
+A stub `sublime` module is installed before the plugin is imported. Its settings are the package defaults
+(cwkWritingToolKit.sublime-settings) with the overrides below, and its packages_path is a scratch directory.
+
+    python3 benchmarks/run_benchmarks.py --size-mb 16 --output results.json
+    python3 benchmarks/run_benchmarks.py --size-mb 16 --baseline results.json
+
+Benchmarks:
+    build        full cwkWordsCollectorThread build, no-op rebuild, one-file incremental rebuild,
+                 corpus cache save and load
+    completion   get_autocomplete_list latency (p50/p99) per prefix length, cold (new generation) and warm (cached)
+    keywords     cwkKeywordStore write and quick panel lookups
+    parsers      cwkEnglishWebDicParser/cwkKoreanWebDicParser throughput on the HTML fixtures, fed in response-sized chunks
+    tokenizer    cwkFileParser throughput on one corpus file
+
+Synthetic corpora are cached under --work-dir by size and seed, so reruns skip the generation.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCH_DIR)
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+SETTINGS_OVERRIDES = {
+    "debug": False,
+    "read_aloud_current_word": False,
+    "watch_corpus_files": False,
+    "web_dic_cache": False,
+}
+
+CORPUS_FILE_MB = 4
+CORPUS_VOCABULARY = 200000
+CORPUS_KEYWORD_RATE = 0.01
+CORPUS_ZIPF_EXPONENT = 1.1
+COMPLETION_PREFIX_LENGTHS = (1, 2, 3, 4)
+COMPLETION_SAMPLES = 200
+PARSER_CHUNK_SIZE = 16 * 1024
+PARSER_ROUNDS = 200
+REGRESSION_THRESHOLD = 0.2
+
+HANGUL = [chr(c) for c in range(0xAC00, 0xD7A4, 7)]
+LATIN = "abcdefghijklmnopqrstuvwxyz"
+KANA = [chr(c) for c in range(0x3042, 0x3094)] + [chr(c) for c in range(0x30A2, 0x30F4)]
+KANJI = [chr(c) for c in range(0x4E00, 0x4E00 + 800)]
+
+
+class StubSettings(dict):
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def set(self, key, value):
+        self[key] = value
+
+
+def loadDefaultSettings():
+    """the package settings file, which allows comments and trailing commas
+    """
+
+    with open(os.path.join(PACKAGE_DIR, "cwkWritingToolKit.sublime-settings"), encoding="utf-8") as fh:
+        text = fh.read()
+    text = re.sub(r'("(?:\\.|[^"\\])*")|//[^\n]*', lambda m: m.group(1) or '', text)
+    text = re.sub(r',(\s*[}\]])', r'\1', text)
+    return json.loads(text)
+
+
+def installSublimeStub(packages_path, overrides):
+    settings = StubSettings(loadDefaultSettings())
+    settings.update(overrides)
+
+    sublime = types.ModuleType("sublime")
+    sublime.INHIBIT_WORD_COMPLETIONS = 8
+    sublime.INHIBIT_EXPLICIT_COMPLETIONS = 16
+    sublime.load_settings = lambda name: settings
+    sublime.packages_path = lambda: packages_path
+    sublime.cache_path = lambda: packages_path
+    sublime.active_window = lambda: None
+    sublime.windows = lambda: []
+    sublime.set_timeout = lambda callback, delay=0: callback()
+    sublime.set_timeout_async = lambda callback, delay=0: callback()
+    sublime.status_message = lambda message: None
+    sublime.Region = lambda a, b=None: (a, a if b is None else b)
+
+    sublime_plugin = types.ModuleType("sublime_plugin")
+
+    class TextCommand:
+        def __init__(self, view):
+            self.view = view
+
+    class WindowCommand:
+        def __init__(self, window):
+            self.window = window
+
+    class EventListener:
+        pass
+
+    sublime_plugin.TextCommand = TextCommand
+    sublime_plugin.WindowCommand = WindowCommand
+    sublime_plugin.ApplicationCommand = type("ApplicationCommand", (), {})
+    sublime_plugin.EventListener = EventListener
+
+    sys.modules["sublime"] = sublime
+    sys.modules["sublime_plugin"] = sublime_plugin
+    os.makedirs(os.path.join(packages_path, "cwkWritingToolkit"), exist_ok=True)
+    return settings
+
+
+class StubView:
+    def set_status(self, key, value):
+        pass
+
+    def erase_status(self, key):
+        pass
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def latencyStats(samples):
+    """milliseconds
+    """
+
+    return {
+        "n": len(samples),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 4),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+        "max_ms": round(max(samples) * 1000, 4) if samples else 0.0,
+    }
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+# synthetic corpora
+
+def makeVocabulary(rng, size):
+    """Korean, English and Japanese words in roughly 5:3:2 proportion
+    """
+
+    words = set()
+    while len(words) < size:
+        script = rng.random()
+        if script < 0.5:
+            word = ''.join(rng.choice(HANGUL) for _ in range(rng.randint(2, 5)))
+        elif script < 0.8:
+            word = ''.join(rng.choice(LATIN) for _ in range(rng.randint(3, 10)))
+        else:
+            word = rng.choice(KANJI) + ''.join(rng.choice(KANA) for _ in range(rng.randint(1, 4)))
+        words.add(word)
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def writeCorpusFile(rng, path, vocabulary, cum_weights, size_bytes):
+    with open(path, "w", encoding="utf-8") as fh:
+        written = 0
+        while written < size_bytes:
+            words = rng.choices(vocabulary, cum_weights=cum_weights, k=2000)
+            for i in range(0, len(words), 40):
+                if rng.random() < CORPUS_KEYWORD_RATE * 40:
+                    j = i + rng.randrange(min(40, len(words) - i))
+                    words[j] = "**" + words[j] + "**"
+            lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+            text = '\n'.join(lines) + '\n'
+            fh.write(text)
+            written += len(text.encode("utf-8"))
+
+
+def makeCorpus(work_dir, size_mb, seed):
+    """a folder of corpus files totalling about size_mb, words drawn from a Zipf distribution
+    """
+
+    folder = os.path.join(work_dir, "corpus-{size}mb-{seed}".format(size=size_mb, seed=seed))
+    marker = os.path.join(folder, ".complete")
+    if os.path.isfile(marker):
+        return folder
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+
+    rng = random.Random(seed)
+    vocabulary = makeVocabulary(rng, CORPUS_VOCABULARY)
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** CORPUS_ZIPF_EXPONENT) for rank in range(1, len(vocabulary) + 1)))
+
+    remaining = int(size_mb * 1024 * 1024)
+    index = 0
+    while remaining > 0:
+        size = min(remaining, CORPUS_FILE_MB * 1024 * 1024)
+        subfolder = os.path.join(folder, "part{num:03d}".format(num=index // 16))
+        os.makedirs(subfolder, exist_ok=True)
+        writeCorpusFile(rng, os.path.join(subfolder, "corpus{num:04d}.md".format(num=index)), vocabulary, cum_weights, size)
+        remaining -= size
+        index += 1
+    with open(marker, "w") as fh:
+        fh.write("ok\n")
+    return folder
+
+
+def corpusFiles(folder):
+    files = []
+    for root, dirs, names in os.walk(folder):
+        files.extend(os.path.join(root, name) for name in names if name.endswith(".md"))
+    return sorted(files)
+
+
+# benchmarks
+
+def benchBuild(cwk, folder):
+    corpus = cwk.cwkCorpus()
+    results = {}
+
+    elapsed, _ = timed(cwk.cwkWordsCollectorThread(corpus, [folder]).collect)
+    num_bytes = sum(os.path.getsize(path) for path in corpusFiles(folder))
+    results["full_build_s"] = round(elapsed, 4)
+    results["full_build_mb_per_s"] = round(num_bytes / 1048576.0 / elapsed, 3)
+    results["files"] = len(corpus.manifest.paths())
+    results["distinct_terms"] = corpus.numTerms()
+    results["occurrences"] = corpus.numWords()
+    results["memory_estimate_mb"] = round(corpus.memoryEstimate() / 1048576.0, 2)
+
+    elapsed, _ = timed(cwk.cwkWordsCollectorThread(corpus, [folder]).collect)
+    results["noop_rebuild_s"] = round(elapsed, 4)
+
+    # the touched file is restored afterwards so the cached corpus stays the same between runs
+
+    touched = corpusFiles(folder)[0]
+    size = os.path.getsize(touched)
+    try:
+        with open(touched, "a", encoding="utf-8") as fh:
+            fh.write("**benchmark** 벤치마크 ベンチマーク\n")
+        elapsed, _ = timed(cwk.cwkWordsCollectorThread(corpus, [folder]).collect)
+        results["one_file_rebuild_s"] = round(elapsed, 4)
+    finally:
+        with open(touched, "r+b") as fh:
+            fh.truncate(size)
+
+    cache = cwk.cwkCorpusCache(folder)
+    elapsed, _ = timed(cache.save, corpus)
+    results["cache_save_s"] = round(elapsed, 4)
+    results["cache_size_mb"] = round(os.path.getsize(cache.cache_file_path) / 1048576.0, 2)
+    elapsed, _ = timed(cache.load, cwk.cwkCorpus())
+    results["cache_load_s"] = round(elapsed, 4)
+    return corpus, results
+
+
+def benchCompletion(cwk, corpus, seed):
+    rng = random.Random(seed)
+    terms = [term for term, _ in corpus.iterWords()]
+    results = {}
+    for length in COMPLETION_PREFIX_LENGTHS:
+        candidates = [term[:length] for term in terms if len(term) >= length]
+        if not candidates:
+            continue
+        prefixes = [rng.choice(candidates) for _ in range(COMPLETION_SAMPLES)]
+        cold = []
+        warm = []
+        for prefix in prefixes:
+            # a new generation makes every cached candidate list stale
+
+            corpus.generation += 1
+            elapsed, _ = timed(corpus.get_autocomplete_list, prefix)
+            cold.append(elapsed)
+            elapsed, _ = timed(corpus.get_autocomplete_list, prefix)
+            warm.append(elapsed)
+        results["prefix_{n}".format(n=length)] = {"cold": latencyStats(cold), "warm": latencyStats(warm)}
+    return results
+
+
+def benchKeywords(cwk, corpus, seed):
+    rng = random.Random(seed)
+    base = cwk.cwkBase()
+    path = base.keyword_file_path
+    store = cwk.cwkKeywordStore(path)
+    keywords = list(corpus.iterKeywords())
+    results = {"keywords": len(set(name for name, _ in keywords))}
+
+    elapsed, _ = timed(store.save, keywords, base.keyword_file_delimiter)
+    results["write_s"] = round(elapsed, 4)
+    results["file_size_mb"] = round(os.path.getsize(path) / 1048576.0, 3)
+    elapsed, store = timed(cwk.cwkKeywordStore.open, path)
+    results["open_s"] = round(elapsed, 4)
+
+    names = [name for name, _ in keywords]
+    for length in COMPLETION_PREFIX_LENGTHS[:3]:
+        samples = []
+        for _ in range(COMPLETION_SAMPLES):
+            word = rng.choice(names)[:length]
+            elapsed, _ = timed(store.matches, word)
+            samples.append(elapsed)
+        results["lookup_{n}".format(n=length)] = latencyStats(samples)
+    return results
+
+
+def benchParsers(cwk):
+    view = StubView()
+    results = {}
+    for name, parser_class in (("english", cwk.cwkEnglishWebDicParser), ("korean", cwk.cwkKoreanWebDicParser)):
+        for filename in sorted(os.listdir(FIXTURES_DIR)):
+            if not filename.startswith("endic" if name == "english" else "krdic"):
+                continue
+            with open(os.path.join(FIXTURES_DIR, filename), "rb") as fh:
+                page = fh.read()
+            chunks = [page[i:i + PARSER_CHUNK_SIZE] for i in range(0, len(page), PARSER_CHUNK_SIZE)]
+
+            consumed = 0
+            start = time.perf_counter()
+            for _ in range(PARSER_ROUNDS):
+                fed = []
+
+                def stream():
+                    for chunk in chunks:
+                        fed.append(len(chunk))
+                        yield chunk
+
+                words = parser_class(view).feedStream(stream())
+                consumed += sum(fed)
+            elapsed = time.perf_counter() - start
+            results[filename] = {
+                "pages_per_s": round(PARSER_ROUNDS / elapsed, 1),
+                "mb_per_s": round(PARSER_ROUNDS * len(page) / 1048576.0 / elapsed, 3),
+                "bytes_read_per_page": consumed // PARSER_ROUNDS,
+                "page_bytes": len(page),
+                "words": len(words),
+            }
+    return results
+
+
+def benchTokenizer(cwk, folder):
+    base = cwk.cwkBase()
+    parser = cwk.cwkFileParser(base.corpus_extensions, base.custom_dictionary_extensions)
+    path = corpusFiles(folder)[-1]
+    elapsed, _ = timed(parser.parse, path)
+    return {"file_mb": round(os.path.getsize(path) / 1048576.0, 3), "mb_per_s": round(os.path.getsize(path) / 1048576.0 / elapsed, 3)}
+
+
+def compareResults(baseline, current, path=(), regressions=None):
+    """(path, baseline, current) of every timing that got slower (or throughput that dropped) by more than the threshold
+    """
+
+    if regressions is None:
+        regressions = []
+    for key, value in current.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compareResults(old or {}, value, path + (key,), regressions)
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old > 0:
+            if key.endswith("_per_s"):
+                worse = value < old * (1 - REGRESSION_THRESHOLD)
+            elif key.endswith("_s") or key.endswith("_ms"):
+                worse = value > old * (1 + REGRESSION_THRESHOLD)
+            else:
+                continue
+            if worse:
+                regressions.append(('.'.join(path + (key,)), old, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size-mb", type=float, default=8, help="synthetic corpus size, 1 to 1024 MB (default 8)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--pool", choices=("thread", "process"), default=None, help="corpus_build_pool override")
+    parser.add_argument("--workers", type=int, default=None, help="corpus_build_workers override")
+    parser.add_argument("--only", action="append", choices=("build", "completion", "keywords", "parsers", "tokenizer"),
+                        help="run only the given benchmark (repeatable); build runs whenever a later one needs the corpus")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "cwkBenchmarks"))
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against an earlier results file; exits with 1 on regressions")
+    args = parser.parse_args()
+
+    overrides = dict(SETTINGS_OVERRIDES)
+    if args.pool:
+        overrides["corpus_build_pool"] = args.pool
+    if args.workers:
+        overrides["corpus_build_workers"] = args.workers
+
+    packages_path = tempfile.mkdtemp(prefix="cwkBench")
+    overrides["persistent_corpus_cache"] = False
+    settings = installSublimeStub(packages_path, overrides)
+    sys.path.insert(0, PACKAGE_DIR)
+    import cwkWritingToolKit as cwk
+
+    selected = set(args.only or ("build", "completion", "keywords", "parsers", "tokenizer"))
+    report = {
+        "version": cwk.VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            "size_mb": args.size_mb,
+            "seed": args.seed,
+            "corpus_build_pool": settings.get("corpus_build_pool"),
+            "corpus_build_workers": settings.get("corpus_build_workers"),
+        },
+        "results": {},
+    }
+    results = report["results"]
+
+    try:
+        if selected & set(("build", "completion", "keywords", "tokenizer")):
+            start = time.perf_counter()
+            folder = makeCorpus(args.work_dir, args.size_mb, args.seed)
+            report["params"]["corpus_generation_s"] = round(time.perf_counter() - start, 2)
+            if "tokenizer" in selected:
+                results["tokenizer"] = benchTokenizer(cwk, folder)
+            if selected & set(("build", "completion", "keywords")):
+                corpus, build = benchBuild(cwk, folder)
+                if "build" in selected:
+                    results["build"] = build
+                if "completion" in selected:
+                    results["completion"] = benchCompletion(cwk, corpus, args.seed)
+                if "keywords" in selected:
+                    results["keywords"] = benchKeywords(cwk, corpus, args.seed)
+        if "parsers" in selected:
+            results["parsers"] = benchParsers(cwk)
+    finally:
+        shutil.rmtree(packages_path, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compareResults(baseline.get("results", {}), results)
+        for key, old, new in regressions:
+            print("REGRESSION {key}: {old} -> {new}".format(key=key, old=old, new=new), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,34 @@ import sublime_plugin
 import os
 import sys
 import codecs
+import io
 import urllib
+import urllib.request
+import urllib.parse
+import urllib.error
+import http.client
+import zlib
+import socket
+import json
 import re
 import threading
 import subprocess
+import shutil
+import collections
+import hashlib
+import mmap
+import struct
+import concurrent.futures
+import multiprocessing
+import select
+import time
+import bisect
+import heapq
+import itertools
+import functools
+import operator
+import math
+from array import array
 from html.parser import HTMLParser
 
 VERSION = "0.4a"
@@ -29,12 +53,71 @@ WEB_JAPANESE_DIC_OPTIONS = "q={query}"
 
 TIMEOUT_SECONDS = 20
 
+# Metrics: latency histogram bucket upper bounds in seconds (the last bucket is unbounded) and the dump file
+
+METRICS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PERCENTILES = (50, 90, 99)
+METRICS_FILE = "cwkMetrics.json"
+
+# Web dictionary requests share keep-alive connections per host and are retried with exponential backoff
+
+HTTP_USER_AGENT = "Mozilla/5.0 (compatible; cwkWritingToolKit/{version})"
+HTTP_CHUNK_SIZE = 16 * 1024
+HTTP_MAX_REDIRECTS = 5
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+HTTP_DRAIN_LIMIT = 64 * 1024
+DEFAULT_HTTP_MAX_CONNECTIONS_PER_HOST = 4
+DEFAULT_HTTP_RETRIES = 2
+DEFAULT_HTTP_RETRY_BACKOFF_SECONDS = 0.5
+
+# Web dictionary lookup cache: append-only JSON lines file next to the keyword file
+
+WEB_DIC_CACHE_FILE = "cwkWebDicCache.jsonl"
+DEFAULT_WEB_DIC_CACHE_TTL_HOURS = 24 * 30
+DEFAULT_WEB_DIC_CACHE_MAX_ENTRIES = 20000
+
+# Batch prefetch into the lookup cache: concurrent requests, requests per second and total requests per run
+
+DEFAULT_WEB_DIC_PREFETCH_WORKERS = 2
+DEFAULT_WEB_DIC_PREFETCH_RATE = 2.0
+DEFAULT_WEB_DIC_PREFETCH_MAX_REQUESTS = 500
+
+# Read aloud: command lines per speech backend. {voice}, {text} and {file} are filled in; render and play are used
+# when rendered audio is cached per (voice, word) under SPEECH_CACHE_DIR
+
+SPEECH_BACKENDS = {
+    'say': {
+        'speak': ['/usr/bin/say', '-v', '{voice}', '{text}'],
+        'render': ['/usr/bin/say', '-v', '{voice}', '-o', '{file}', '{text}'],
+        'play': ['/usr/bin/afplay', '{file}'],
+        'extension': '.aiff',
+    },
+    'espeak': {
+        'speak': ['espeak', '-v', '{voice}', '{text}'],
+        'render': ['espeak', '-v', '{voice}', '-w', '{file}', '{text}'],
+        'play': ['aplay', '-q', '{file}'],
+        'extension': '.wav',
+    },
+}
+DEFAULT_SPEECH_BACKEND = 'say'
+SPEECH_CACHE_DIR = "cwkSpeechCache"
+
 ENGLISH_TARGET_BLOCK_TAG = 'span'
 ENGLISH_TARGET_SYNONYM_TAG = 'a'
 ENGLISH_TARGET_SYNONYM_LABEL = '[유의어]'
 
 
 MAX_QUERY_DEPTH = 20
+
+# Korean synonyms are expanded breadth-first: levels, workers per level, total requests (MAX_QUERY_DEPTH) and deadline
+
+DEFAULT_KOREAN_SYNONYM_MAX_DEPTH = 3
+DEFAULT_KOREAN_SYNONYM_WORKERS = 4
+DEFAULT_WEB_DIC_PROGRESS_INTERVAL_SECONDS = 0.5
+
+# web dictionary parsers update the status bar at most this often while a page streams in
+
+WEB_DIC_STATUS_INTERVAL_SECONDS = 0.25
 KOREAN_TARGET_SYNONYM_TAG = 'a'
 KOREAN_TARGET_SYNONYM_CLASS_ID = 'syno'
 KOREAN_TARGET_BLOCK_TAG = 'span'
@@ -52,14 +135,172 @@ CUSTOM_DICTIONARY_COMMENT_CHAR = '#'
 
 MAX_AUTOCOMPLETE_SUGGETIONS = 100
 
+CORPUS_WORD = 'word'
+CORPUS_KEYWORD = 'keyword'
+
+# surface forms folded into a base word: (surface, base) pairs with their counts, kept out of the completion indexes
+
+CORPUS_VARIANT = 'variant'
+CORPUS_KINDS = (CORPUS_WORD, CORPUS_KEYWORD, CORPUS_VARIANT)
+CORPUS_INDEXED_KINDS = (CORPUS_WORD, CORPUS_KEYWORD)
+
+# Korean particles (josa) and 하다 endings stripped from corpus words. A word is folded into its base only when the
+# base also occurs on its own in the same file, or at least two different forms of it do.
+
+KOREAN_JOSA = [
+    "은", "는", "이", "가", "을", "를", "의", "에", "에서", "에게", "에게서", "께", "께서", "한테", "한테서",
+    "로", "으로", "로서", "으로서", "로써", "으로써", "와", "과", "도", "만", "까지", "부터", "보다", "처럼",
+    "마다", "조차", "마저", "이나", "나", "이며", "며", "이랑", "랑", "하고", "이란", "란", "이라는", "라는",
+    "에는", "에서는", "에게는", "으로는", "로는", "와는", "과는", "에도", "에서도", "으로도", "로도", "와도", "과도",
+    "까지도", "부터는", "만은", "만을", "이다", "였다", "이었다", "입니다", "이고", "이지만",
+]
+KOREAN_ENDINGS = [
+    "하다", "한다", "했다", "하는", "하고", "하여", "해서", "했던", "하며", "하지", "합니다", "했습니다", "하게", "하기",
+]
+
+COMPLETION_INDEX_GRAM_SIZES = (1, 2)
+
+# Fuzzy completion: terms are indexed by every string left after deleting up to max distance characters from their
+# first FUZZY_PREFIX_LENGTH characters
+
+FUZZY_PREFIX_LENGTH = 7
+DEFAULT_FUZZY_MAX_DISTANCE = 2
+FUZZY_DELETE_MEMORY_ESTIMATE_BYTES = 100
+
+# Completion ranking: score = frequency + recency + prefix and current-view bonuses
+
+RANK_FREQUENCY_WEIGHT = 1.0
+RANK_RECENCY_WEIGHT = 2.0
+RANK_RECENCY_HALF_LIFE_DAYS = 7.0
+RANK_PREFIX_BONUS = 3.0
+RANK_IN_VIEW_BONUS = 2.0
+DEFAULT_MAX_RANKED_CANDIDATES = 200000
+
+DEFAULT_COMPLETION_CACHE_SIZE = 64
+
+# The completion cache also holds at most this many max_ranked_candidates lists' worth of candidates in total; each
+# cached candidate (a tuple in a list, the term itself is shared) takes about this many bytes
+
+COMPLETION_CACHE_CANDIDATE_LISTS = 4
+COMPLETION_CACHE_CANDIDATE_MEMORY_ESTIMATE_BYTES = 64
+
+MANIFEST_DIGEST_CHUNK_SIZE = 1024 * 1024
+
+# Corpus registry: one index per project folder set, evicted least recently used first past the memory budget
+
+DEFAULT_CORPUS_MEMORY_BUDGET_MB = 512
+
+# Memory estimate per item, measured with tracemalloc on the 8 MB benchmark corpus (Python 3.11): store terms and
+# labels (string, id dict slot, stats), indexed terms (entries dict), (label, number of files) entries, n-grams
+# (key, set) and n-gram postings (set slots)
+
+CORPUS_TERM_MEMORY_ESTIMATE_BYTES = 190
+INDEX_TERM_MEMORY_ESTIMATE_BYTES = 170
+INDEX_ENTRY_MEMORY_ESTIMATE_BYTES = 40
+INDEX_GRAM_MEMORY_ESTIMATE_BYTES = 316
+INDEX_POSTING_MEMORY_ESTIMATE_BYTES = 53
+
+# Parallel corpus builds: "thread" or "process" pools
+
+DEFAULT_CORPUS_BUILD_WORKERS = 4
+DEFAULT_CORPUS_BUILD_POOL = 'thread'
+
+# Batches of changed files larger than this are applied to a live corpus one file at a time under its lock
+
+CORPUS_ATOMIC_BATCH_FILES = 64
+
+# Corpus file watcher: inotify on Linux, stat polling elsewhere
+
+DEFAULT_CORPUS_WATCH_DEBOUNCE_SECONDS = 1.0
+DEFAULT_CORPUS_WATCH_POLL_SECONDS = 5.0
+
+INOTIFY_IN_CLOSE_WRITE = 0x00000008
+INOTIFY_IN_MOVED_FROM = 0x00000040
+INOTIFY_IN_MOVED_TO = 0x00000080
+INOTIFY_IN_CREATE = 0x00000100
+INOTIFY_IN_DELETE = 0x00000200
+INOTIFY_IN_DELETE_SELF = 0x00000400
+INOTIFY_IN_Q_OVERFLOW = 0x00004000
+INOTIFY_IN_IGNORED = 0x00008000
+INOTIFY_IN_ISDIR = 0x40000000
+INOTIFY_IN_NONBLOCK = 0o4000
+INOTIFY_IN_CLOEXEC = 0o2000000
+INOTIFY_WATCH_MASK = INOTIFY_IN_CLOSE_WRITE | INOTIFY_IN_MOVED_FROM | INOTIFY_IN_MOVED_TO | INOTIFY_IN_CREATE | INOTIFY_IN_DELETE | INOTIFY_IN_DELETE_SELF
+
+# Persistent corpus cache: one binary file per project folder
+
+CORPUS_CACHE_DIR = "cwkCorpusCache"
+CORPUS_CACHE_EXTENSION = ".cwkidx"
+CORPUS_CACHE_MAGIC = b'CWKC'
+CORPUS_CACHE_VERSION = 3
+
+# The keyword file holds the distinct keywords sorted, with an offsets table for binary search
+
+KEYWORD_STORE_MAGIC = b'CWKK'
+KEYWORD_STORE_VERSION = 1
+
 DEFAULT_WEB_DIC_DISPLAY_METHOD = 'quick_panel'
 
 KEYWORD_REGEX = r'\*\*([^*]+)\*\*'
+TAG_REGEX = r'<[^>]+>'
+
+# english, korean, japanese words; keywords and words are matched by one combined pattern in the tokenizer
+
+WORD_REGEX = r'[\w가-힣一-龠あ-んア-ン]+'
+CORPUS_TOKEN_REGEX = r'\*\*[^*\n]+\*\*|' + WORD_REGEX
+
+# Scripts are bit flags, so a term's mask holds every script it contains; characters are classified by table lookup
+
+SCRIPT_HANGUL = 1
+SCRIPT_LATIN = 2
+SCRIPT_KANA = 4
+SCRIPT_HAN = 8
+SCRIPT_NAMES = {'hangul': SCRIPT_HANGUL, 'latin': SCRIPT_LATIN, 'kana': SCRIPT_KANA, 'han': SCRIPT_HAN}
+SCRIPT_RANGES = [
+    (0x0041, 0x005A, SCRIPT_LATIN),
+    (0x0061, 0x007A, SCRIPT_LATIN),
+    (0x3041, 0x309F, SCRIPT_KANA),
+    (0x30A0, 0x30FF, SCRIPT_KANA),
+    (0x4E00, 0x9FFF, SCRIPT_HAN),
+    (0xAC00, 0xD7A3, SCRIPT_HANGUL),
+]
+
+TOKENIZER_CHUNK_SIZE = 4 * 1024 * 1024
+
+class cwkScriptClassifier:
+    """classifies characters by script with one lookup in a table covering every code point, built from SCRIPT_RANGES
+    """
+
+    def __init__(self, ranges=SCRIPT_RANGES):
+        self._table = bytearray(sys.maxunicode + 1)
+        for start, end, script in ranges:
+            self._table[start:end + 1] = bytes([script]) * (end - start + 1)
+
+    def leading(self, word):
+        """script of the first character, 0 for an empty word or an unclassified character
+        """
+
+        return self._table[ord(word[0])] if word else 0
+
+    def scripts(self, word):
+        """mask of every script in the word
+        """
+
+        return functools.reduce(operator.or_, map(self._table.__getitem__, map(ord, word)), 0)
+
+    def classify(self, words):
+        """script masks of a batch of words
+        """
+
+        lookup = self._table.__getitem__
+        return [functools.reduce(operator.or_, map(lookup, map(ord, word)), 0) for word in words]
+
 
 class cwkBase:
     def __init__(self):
         self.plugin_settings = sublime.load_settings("cwkWritingToolKit.sublime-settings")
         self.debug = self.plugin_settings.get("debug", False)
+        self.collect_metrics = self.plugin_settings.get("collect_metrics", False)
         self.read_aloud = self.plugin_settings.get("read_aloud_current_word", False)
         self.keyword_file = self.plugin_settings.get("keyword_file", "cwkKeywords.tmp")
 
@@ -69,38 +310,71 @@ class cwkBase:
         self.english_voice = self.plugin_settings.get("english_voice", False)
         self.korean_voice = self.plugin_settings.get("korean_voice", False)
         self.japanese_voice = self.plugin_settings.get("japanese_voice", False)
+        self.speech_backend = self.plugin_settings.get("speech_backend", DEFAULT_SPEECH_BACKEND)
+        self.speech_command = self.plugin_settings.get("speech_command", {})
+        self.speech_cache = self.plugin_settings.get("speech_cache", False)
+        self.speech_cache_dir = os.path.join(os.path.dirname(self.keyword_file_path), SPEECH_CACHE_DIR)
         self.corpus_extensions = self.plugin_settings.get("corpus_extensions", [])
+        self.normalize_korean_endings = self.plugin_settings.get("normalize_korean_endings", True)
         self.custom_dictionary_extensions = self.plugin_settings.get("custom_dictionary_extensions", ['.cwkcsv',])
         self.force_rebuild_corpus_on_every_save = self.plugin_settings.get("force_rebuild_corpus_on_every_save", True)
+        self.incremental_corpus_rebuild = self.plugin_settings.get("incremental_corpus_rebuild", True)
+        self.persistent_corpus_cache = self.plugin_settings.get("persistent_corpus_cache", True)
+        self.corpus_build_workers = self.plugin_settings.get("corpus_build_workers", DEFAULT_CORPUS_BUILD_WORKERS)
+        self.corpus_build_pool = self.plugin_settings.get("corpus_build_pool", DEFAULT_CORPUS_BUILD_POOL)
+        self.corpus_memory_budget_mb = self.plugin_settings.get("corpus_memory_budget_mb", DEFAULT_CORPUS_MEMORY_BUDGET_MB)
+        self.watch_corpus_files = self.plugin_settings.get("watch_corpus_files", True)
+        self.corpus_watch_debounce_seconds = self.plugin_settings.get("corpus_watch_debounce_seconds", DEFAULT_CORPUS_WATCH_DEBOUNCE_SECONDS)
+        self.corpus_watch_poll_seconds = self.plugin_settings.get("corpus_watch_poll_seconds", DEFAULT_CORPUS_WATCH_POLL_SECONDS)
+        self.corpus_cache_dir = os.path.join(os.path.dirname(self.keyword_file_path), CORPUS_CACHE_DIR)
         self.max_autocomplete_suggestions = self.plugin_settings.get("max_autocomplete_suggestions", MAX_AUTOCOMPLETE_SUGGETIONS)
+        self.rank_completions = self.plugin_settings.get("rank_completions", True)
+        self.max_ranked_candidates = self.plugin_settings.get("max_ranked_candidates", DEFAULT_MAX_RANKED_CANDIDATES)
+        self.completion_cache_size = self.plugin_settings.get("completion_cache_size", DEFAULT_COMPLETION_CACHE_SIZE)
+        self.completion_scripts = self.plugin_settings.get("completion_scripts", [])
+        self.fuzzy_completion = self.plugin_settings.get("fuzzy_completion", False)
+        self.fuzzy_max_distance = self.plugin_settings.get("fuzzy_max_distance", DEFAULT_FUZZY_MAX_DISTANCE)
+        self.fuzzy_korean_jamo = self.plugin_settings.get("fuzzy_korean_jamo", True)
         self.web_dic_display_method = self.plugin_settings.get("web_dic_display_method", DEFAULT_WEB_DIC_DISPLAY_METHOD)
+        self.web_dic_progressive_display = self.plugin_settings.get("web_dic_progressive_display", True)
+        self.local_synonyms = self.plugin_settings.get("local_synonyms", True)
+        self.web_dic_progress_interval_seconds = self.plugin_settings.get("web_dic_progress_interval_seconds", DEFAULT_WEB_DIC_PROGRESS_INTERVAL_SECONDS)
+        self.english_dic_url = self.plugin_settings.get("english_dic_url", WEB_ENGLISH_DIC_URL)
+        self.korean_dic_url = self.plugin_settings.get("korean_dic_url", WEB_KOREAN_DIC_URL)
+        self.korean_synonym_max_depth = self.plugin_settings.get("korean_synonym_max_depth", DEFAULT_KOREAN_SYNONYM_MAX_DEPTH)
+        self.korean_synonym_max_requests = self.plugin_settings.get("korean_synonym_max_requests", MAX_QUERY_DEPTH)
+        self.korean_synonym_workers = self.plugin_settings.get("korean_synonym_workers", DEFAULT_KOREAN_SYNONYM_WORKERS)
+        self.korean_synonym_deadline_seconds = self.plugin_settings.get("korean_synonym_deadline_seconds", TIMEOUT_SECONDS)
+        self.http_max_connections_per_host = self.plugin_settings.get("http_max_connections_per_host", DEFAULT_HTTP_MAX_CONNECTIONS_PER_HOST)
+        self.http_retries = self.plugin_settings.get("http_retries", DEFAULT_HTTP_RETRIES)
+        self.http_retry_backoff_seconds = self.plugin_settings.get("http_retry_backoff_seconds", DEFAULT_HTTP_RETRY_BACKOFF_SECONDS)
+        self.web_dic_cache = self.plugin_settings.get("web_dic_cache", True)
+        self.web_dic_cache_ttl_hours = self.plugin_settings.get("web_dic_cache_ttl_hours", DEFAULT_WEB_DIC_CACHE_TTL_HOURS)
+        self.web_dic_cache_max_entries = self.plugin_settings.get("web_dic_cache_max_entries", DEFAULT_WEB_DIC_CACHE_MAX_ENTRIES)
+        self.web_dic_cache_stale_while_revalidate = self.plugin_settings.get("web_dic_cache_stale_while_revalidate", True)
+        self.web_dic_cache_path = os.path.join(os.path.dirname(self.keyword_file_path), WEB_DIC_CACHE_FILE)
+        self.web_dic_prefetch_workers = self.plugin_settings.get("web_dic_prefetch_workers", DEFAULT_WEB_DIC_PREFETCH_WORKERS)
+        self.web_dic_prefetch_rate = self.plugin_settings.get("web_dic_prefetch_rate", DEFAULT_WEB_DIC_PREFETCH_RATE)
+        self.web_dic_prefetch_max_requests = self.plugin_settings.get("web_dic_prefetch_max_requests", DEFAULT_WEB_DIC_PREFETCH_MAX_REQUESTS)
 
         self._words = []
         self._keywords = []
 
+    _scripts = cwkScriptClassifier()
+
     def isKorean(self, word):
-        if re.match(r'(^[가-힣]+)', word):
-            return True
-        else:
-            return False
+        return self._scripts.leading(word) == SCRIPT_HANGUL
 
     def isEnglish(self, word):
-        if re.match(r'(^[a-zA-Z]+)', word):
-            return True
-        else:
-            return False
+        return self._scripts.leading(word) == SCRIPT_LATIN
 
     def isJapanese(self, word):
-        if re.match(r'[一-龠あ-んア-ン]+', word):
-            return True
-        else:
-            return False
+        return self._scripts.leading(word) in (SCRIPT_KANA, SCRIPT_HAN)
+
+    _useless_endings = tuple(USELESS_ENDINGS)
 
     def isEndingOkay(self, word):
-        for ending in USELESS_ENDINGS:
-            if word.endswith(ending):
-                return False
-        return True
+        return not word.endswith(self._useless_endings)
 
     def isCorpusFile(self, filename):
         """check if the given file should be parsed
@@ -122,20 +396,65 @@ class cwkBase:
             self.log("Error reading {filename}: {error}".format(filename=filename, error=e))
             return False
 
+    def getWordFiles(self, folder, *args):
+        """resursive method parsing every corpus and dictionary file in the given folder and its subfolders
+        """
+
+        autocomplete_word_files = []
+        folders = os.listdir(folder)
+        folders.sort(reverse=True)
+        for file in folders:
+            if file.startswith('.'):
+                continue
+            fullpath = os.path.join(folder, file)
+
+            if os.path.isfile(fullpath) and (self.isCorpusFile(fullpath) or self.isDictionaryFile(fullpath)):
+                autocomplete_word_files.append(fullpath)
+            elif os.path.isdir(fullpath):
+                autocomplete_word_files += self.getWordFiles(fullpath, *args)
+        return autocomplete_word_files
+
+    def getCorpusFiles(self, folders):
+        """every corpus and dictionary file in the given folders, skipping archives
+        """
+
+        files = []
+        num_archived = 0
+        for folder in folders:
+            # skip archives
+            if "/_" in folder:
+                self.log("Skipping the archived folder: {name}".format(name=folder))
+                continue
+            for filename in self.getWordFiles(folder):
+                if "/_" in filename:
+                    num_archived += 1
+                    continue
+                files.append(filename)
+        cwkMetrics.instance().count('build.archived_files_skipped', num_archived)
+        return files
+
+    def keywordFilePath(self, folders):
+        """the keyword file of a project folder set: keyword_file with a digest of the sorted folders before its
+        extension, so that every project keeps the keywords of its own corpus
+        """
+
+        root, extension = os.path.splitext(self.keyword_file_path)
+        folders_digest = hashlib.md5('\n'.join(sorted(folders)).encode('utf-8')).hexdigest()
+        return root + '-' + folders_digest + extension
+
+    _tag_pattern = re.compile(TAG_REGEX)
+
     def removeTags(self, line):
         """clean up HTML tags
         """
-        pattern = re.compile(r'<[^>]+>')
-        return pattern.sub('', line)
+        return self._tag_pattern.sub('', line)
 
     def readAloud(self, message):
-        """Mac OSX only: read alound the given message using system voices
+        """read aloud the given message in the background using the voice of its language. Returns at once;
+        see cwkSpeechQueue
         """
 
-        if sys.platform != 'darwin':
-            return
-
-        if message:
+        if self.read_aloud and message:
             voice = ""
             if self.isEnglish(message):
                 voice = self.english_voice
@@ -144,8 +463,7 @@ class cwkBase:
             elif self.isJapanese(message):
                 voice = self.japanese_voice
 
-            shell_command = ["/usr/bin/say", "-v", voice, message]
-            subprocess.call(shell_command)
+            cwkSpeechQueue.instance().say(message, voice)
 
     def log(self, message):
         """utility method to print out debug messages
@@ -155,213 +473,2562 @@ class cwkBase:
             print("[cwk log] ==  {msg}".format(msg=message))
 
 
-class cwkWord:
-    _name = ""
-    _filename = ""
+class cwkNullTimer:
+    """the timer handed out while metrics are off
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class cwkMetricsTimer:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class cwkMetrics(cwkBase):
+    """process-wide counters and timers. Every timer keeps its count, total, maximum and a latency histogram over
+    METRICS_BUCKETS. While collect_metrics is off, count() and observe() return at once and timer() hands out a
+    shared no-op timer, so instrumented hot paths cost one attribute check.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    _null_timer = cwkNullTimer()
+
+    @classmethod
+    def instance(cls):
+        """the metrics shared by every thread. Called on hot paths, so the lock is only taken until it exists
+        """
+
+        metrics = cls._instance
+        if metrics is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+                metrics = cls._instance
+        return metrics
+
+    def __init__(self):
+        cwkBase.__init__(self)
+        self.enabled = self.collect_metrics
+        self.metrics_file_path = os.path.join(os.path.dirname(self.keyword_file_path), METRICS_FILE)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = time.time()
+            self._counters = collections.Counter()
+            self._timers = {}
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] += n
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = [0, 0.0, 0.0, array('L', [0] * (len(METRICS_BUCKETS) + 1))]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+            timer[3][bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+
+    def timer(self, name):
+        """context manager observing the time spent in its block under the given name
+        """
+
+        if not self.enabled:
+            return self._null_timer
+        return cwkMetricsTimer(self, name)
+
+    def percentile(self, buckets, count, percent):
+        """upper bound of the bucket holding the given percentile, None when it falls in the unbounded bucket.
+        Estimates are reported capped at the timer's maximum.
+        """
+
+        rank = count * percent / 100.0
+        seen = 0
+        for bound, num in zip(METRICS_BUCKETS, buckets):
+            seen += num
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        """counters, hit rates of every <name>.hit/<name>.miss counter pair, and timer summaries in milliseconds
+        """
+
+        with self._lock:
+            counters = dict(self._counters)
+            timers = dict((name, (timer[0], timer[1], timer[2], array('L', timer[3]))) for name, timer in self._timers.items())
+
+        hit_rates = {}
+        for name, hits in counters.items():
+            if name.endswith('.hit'):
+                prefix = name[:-len('.hit')]
+                total = hits + counters.get(prefix + '.miss', 0)
+                hit_rates[prefix] = round(hits / total, 4) if total else None
+
+        timer_summaries = {}
+        for name, (count, total, longest, buckets) in timers.items():
+            summary = {
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'mean_ms': round(total * 1000 / count, 3),
+                'max_ms': round(longest * 1000, 3),
+                'histogram': dict(("<={:g}ms".format(bound * 1000), num) for bound, num in zip(METRICS_BUCKETS, buckets) if num),
+            }
+            if buckets[-1]:
+                summary['histogram'][">{:g}ms".format(METRICS_BUCKETS[-1] * 1000)] = buckets[-1]
+            for percent in METRICS_PERCENTILES:
+                bound = self.percentile(buckets, count, percent)
+                summary['p{}_ms'.format(percent)] = round(min(bound, longest) * 1000, 3) if bound is not None else None
+            timer_summaries[name] = summary
+
+        return {
+            'enabled': self.enabled,
+            'since': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._started)),
+            'counters': counters,
+            'hit_rates': hit_rates,
+            'timers': timer_summaries,
+        }
+
+    def dump(self):
+        """writes the snapshot to the metrics file and returns it
+        """
+
+        snapshot = self.snapshot()
+        if not os.path.isdir(os.path.dirname(self.metrics_file_path)):
+            os.makedirs(os.path.dirname(self.metrics_file_path))
+        tmp_path = self.metrics_file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(snapshot, fh, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.metrics_file_path)
+        return snapshot
+
+    def report(self, snapshot):
+        """the snapshot as plain text lines
+        """
+
+        lines = ["cwkWritingToolKit metrics since {since}{off}".format(since=snapshot['since'], off="" if snapshot['enabled'] else " (collect_metrics is off)"), ""]
+        if snapshot['timers']:
+            lines.append("{:<32} {:>8} {:>10} {:>9} {:>9} {:>9} {:>10}".format("timer", "count", "total ms", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+            for name, summary in sorted(snapshot['timers'].items()):
+                percentiles = ["{:>9}".format("-" if summary[key] is None else "{:g}".format(summary[key])) for key in ('p50_ms', 'p90_ms', 'p99_ms')]
+                lines.append("{:<32} {:>8} {:>10.1f} {} {:>10.3f}".format(name, summary['count'], summary['total_ms'], " ".join(percentiles), summary['max_ms']))
+            lines.append("")
+        for name, rate in sorted(snapshot['hit_rates'].items()):
+            lines.append("{:<32} {}".format(name + " hit rate", "-" if rate is None else "{:.1%}".format(rate)))
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append("{:<32} {}".format(name, value))
+        return lines
+
+
+class cwkTermStore:
+    """deduplicated term store: each distinct term and label (file name, or synonym for dictionary rows) is interned once
+    and given a small integer id. Occurrences are kept as per-term counts and per-file postings, the latter packed into
+    arrays of (term id, label id, count) triples.
+    """
+
+    # every term is tagged with the mask of the scripts it contains when it is first stored
+
+    _scripts = cwkBase._scripts
+
+    def __init__(self):
+        self._terms = []
+        self._term_ids = {}
+        self._term_counts = array('L')
+        self._term_mtimes = array('d')
+        self._term_scripts = bytearray()
+        self._free_term_ids = []
+        self._labels = []
+        self._label_ids = {}
+        self._postings = dict((kind, {}) for kind in CORPUS_KINDS)
+        self._pending = {}
+        self._num_occurrences = 0
+
+    def numTerms(self):
+        return len(self._term_ids)
+
+    def numOccurrences(self):
+        return self._num_occurrences
+
+    def memoryEstimate(self):
+        """rough size in bytes: a fixed per-term overhead (string, dict slots, stats) plus the packed postings
+        """
+
+        postings_bytes = 0
+        for kind_postings in self._postings.values():
+            for postings in list(kind_postings.values()):
+                postings_bytes += len(postings) * postings.itemsize
+        return (len(self._term_ids) + len(self._labels)) * CORPUS_TERM_MEMORY_ESTIMATE_BYTES + postings_bytes
+
+    def termCount(self, term):
+        term_id = self._term_ids.get(term)
+        return self._term_counts[term_id] if term_id is not None else 0
+
+    def termStats(self, term):
+        """(occurrence count, mtime of the most recently modified file it was collected from)
+        """
+
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            return 0, 0.0
+        return self._term_counts[term_id], self._term_mtimes[term_id]
+
+    def termScripts(self, term):
+        term_id = self._term_ids.get(term)
+        return self._term_scripts[term_id] if term_id is not None else 0
+
+    def termId(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term = sys.intern(term)
+            scripts = self._scripts.scripts(term)
+            if self._free_term_ids:
+                term_id = self._free_term_ids.pop()
+                self._terms[term_id] = term
+                self._term_counts[term_id] = 0
+                self._term_mtimes[term_id] = 0.0
+                self._term_scripts[term_id] = scripts
+            else:
+                term_id = len(self._terms)
+                self._terms.append(term)
+                self._term_counts.append(0)
+                self._term_mtimes.append(0.0)
+                self._term_scripts.append(scripts)
+            self._term_ids[term] = term_id
+        return term_id
+
+    def restore(self, terms, labels, counts, mtimes, scripts, num_occurrences, postings):
+        """fills an empty store at once from a corpus cache: the cached term and label ids become the store's ids,
+        so the packed postings ({kind: {path: triples}}) are taken over as they are
+        """
+
+        self._terms = terms
+        self._term_ids = dict(zip(terms, range(len(terms))))
+        self._term_counts = array('L', counts)
+        self._term_mtimes = mtimes
+        self._term_scripts = scripts
+        self._free_term_ids = []
+        self._labels = labels
+        self._label_ids = dict(zip(labels, range(len(labels))))
+        self._postings = postings
+        self._num_occurrences = num_occurrences
+
+    def labelId(self, label):
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = len(self._labels)
+            self._labels.append(sys.intern(label))
+            self._label_ids[label] = label_id
+        return label_id
+
+    def add(self, kind, path, term, label, count=1):
+        """records occurrences; they stay pending until the file is committed
+        """
+
+        key = (self.termId(term), self.labelId(label))
+        self._term_counts[key[0]] += count
+        if kind != CORPUS_VARIANT:
+            self._num_occurrences += count
+        pending = self._pending.setdefault((kind, path), {})
+        pending[key] = pending.get(key, 0) + count
 
-    def __init__(self, name, filename):
-        self._name = name
-        self._filename = filename
+    def commit(self, path, mtime=0.0):
+        """packs the pending occurrences of the file into its postings and returns the new (kind, term, label) pairs
+        """
+
+        added = []
+        term_mtimes = self._term_mtimes
+        for kind in CORPUS_KINDS:
+            pending = self._pending.pop((kind, path), None)
+            if not pending:
+                continue
+            postings = array('I')
+            for (term_id, label_id), count in pending.items():
+                postings.extend((term_id, label_id, count))
+                if term_mtimes[term_id] < mtime:
+                    term_mtimes[term_id] = mtime
+                added.append((kind, self._terms[term_id], self._labels[label_id]))
+            self._postings[kind][path] = postings
+        return added
+
+    def remove(self, path):
+        """retracts every occurrence recorded for the file and returns the removed (kind, term, label) pairs
+        """
+
+        removed = []
+        for kind in CORPUS_KINDS:
+            postings = self._postings[kind].pop(path, None)
+            if postings is None:
+                continue
+            for i in range(0, len(postings), 3):
+                term_id, label_id, count = postings[i], postings[i + 1], postings[i + 2]
+                term = self._terms[term_id]
+                removed.append((kind, term, self._labels[label_id]))
+                if kind != CORPUS_VARIANT:
+                    self._num_occurrences -= count
+                self._term_counts[term_id] -= count
+                if self._term_counts[term_id] == 0:
+                    del self._term_ids[term]
+                    self._terms[term_id] = None
+                    self._free_term_ids.append(term_id)
+        return removed
+
+    def fileTriples(self, kind, path):
+        """yields the (term, label, count) triples committed for the file
+        """
+
+        postings = self._postings[kind].get(path)
+        if postings is None:
+            return
+        for i in range(0, len(postings), 3):
+            yield self._terms[postings[i]], self._labels[postings[i + 1]], postings[i + 2]
+
+    def iterPairs(self, kind):
+        """yields the distinct (term, label) pairs of the given kind, file by file
+        """
+
+        for postings in list(self._postings[kind].values()):
+            for i in range(0, len(postings), 3):
+                yield self._terms[postings[i]], self._labels[postings[i + 1]]
+
+
+class cwkManifestEntry:
+    _mtime = 0
+    _size = 0
+    _digest = ""
+
+    def __init__(self, mtime, size, digest):
+        self._mtime = mtime
+        self._size = size
+        self._digest = digest
 
     @property
-    def name(self):
-        return self._name
+    def mtime(self):
+        return self._mtime
 
-    @name.setter
-    def name(self, value):
-        self._name = value
+    @property
+    def size(self):
+        return self._size
 
     @property
-    def filename(self):
-        return self._filename
+    def digest(self):
+        return self._digest
+
+
+class cwkFileManifest:
+    """per-file manifest (path, mtime, size, content hash) of the files the corpus was built from
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def clear(self):
+        self._entries = {}
+
+    def paths(self):
+        return list(self._entries.keys())
+
+    def get(self, path):
+        return self._entries.get(path)
+
+    def update(self, path, mtime, size, digest):
+        self._entries[path] = cwkManifestEntry(mtime, size, digest)
+
+    def remove(self, path):
+        self._entries.pop(path, None)
+
+    def fileDigest(self, path):
+        """content hash used to tell a real edit from a touch that only bumped mtime
+        """
+
+        md5 = hashlib.md5()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(MANIFEST_DIGEST_CHUNK_SIZE), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+
+class cwkFuzzyMatcher:
+    """SymSpell-style matching within a small edit distance. Terms and queries are cut to a key of the first
+    FUZZY_PREFIX_LENGTH characters; two keys within the distance share at least one of their deletion variants, so
+    candidates come from a handful of dict lookups. They are then checked with the real distance (optimal string
+    alignment: insertions, deletions, substitutions and adjacent transpositions) between the whole typed word and
+    the closest prefix of the term, as the word being typed is usually incomplete.
+
+    With jamo on, the distance is measured over Hangul syllables decomposed into jamo, so a wrong final consonant
+    counts as one edit and a wholly different syllable as up to three. Candidates are still looked up by syllable,
+    which keeps the index as small as without jamo; a typo that shifts a consonant into the next syllable can be
+    missed.
+    """
+
+    _jamo_table = None
+
+    def __init__(self, max_distance=DEFAULT_FUZZY_MAX_DISTANCE, jamo=False):
+        self.max_distance = max(1, min(max_distance, 2))
+        self.jamo = jamo
+        self.prefix_length = FUZZY_PREFIX_LENGTH
+        if jamo and cwkFuzzyMatcher._jamo_table is None:
+            cwkFuzzyMatcher._jamo_table = self.jamoTable()
+
+    @staticmethod
+    def jamoTable():
+        """str.translate table decomposing every Hangul syllable into its leading, vowel and trailing jamo
+        """
+
+        table = {}
+        for index in range(11172):
+            lead, rest = divmod(index, 588)
+            vowel, tail = divmod(rest, 28)
+            table[0xAC00 + index] = chr(0x1100 + lead) + chr(0x1161 + vowel) + (chr(0x11A7 + tail) if tail else '')
+        return table
+
+    def key(self, term):
+        return term[:self.prefix_length]
+
+    def measured(self, key):
+        """the key as its distance is measured
+        """
+
+        return key.translate(self._jamo_table) if self.jamo else key
+
+    def limit(self, measured):
+        """distance allowed for the measured key: short keys get fewer edits so that not everything matches
+        """
+
+        return min(self.max_distance, (len(measured) - 1) // 2)
+
+    def deletes(self, key, distance=None):
+        """the key and every string left after deleting up to `distance` of its characters
+        """
+
+        distance = self.max_distance if distance is None else distance
+        n = len(key)
+        variants = {key}
+        if n > 1:
+            variants.update([key[:i] + key[i + 1:] for i in range(n)])
+        if distance > 1 and n > 2:
+            variants.update([key[:i] + key[i + 1:j] + key[j + 1:] for i in range(n) for j in range(i + 1, n)])
+        return variants
+
+    def prefixDistance(self, word, term, limit):
+        """distance between the word and the closest prefix of the term (of the word's length give or take the
+        limit), or limit + 1 as soon as it must exceed the limit
+        """
+
+        term = term[:len(word) + limit]
+        if len(term) < len(word) - limit:
+            return limit + 1
+        before = None
+        previous = list(range(len(term) + 1))
+        for i in range(1, len(word) + 1):
+            current = [i] + [0] * len(term)
+            for j in range(1, len(term) + 1):
+                value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word[i - 1] != term[j - 1]))
+                if i > 1 and j > 1 and word[i - 1] == term[j - 2] and word[i - 2] == term[j - 1]:
+                    value = min(value, before[j - 2] + 1)
+                current[j] = value
+            if min(current) > limit:
+                return limit + 1
+            before, previous = previous, current
+        return min(previous[max(0, len(word) - limit):])
+
+
+class cwkCompletionIndex:
+    """completion index over deduplicated terms: a sorted term array searched with bisect for prefixes
+    and a character n-gram index for substring matches. Given a cwkFuzzyMatcher, it also keeps the deletion
+    variants of every term for fuzzy matches.
+
+    Terms added or removed since the last flush() are kept aside and folded into the sorted array in one sort,
+    so a batch of n new terms costs a sort rather than n insertions into the middle of the array.
+
+    An index restored from the corpus cache keeps the cached entries and gram postings packed in arrays and turns
+    them into dicts and sets only when a term or gram is first touched.
+    """
+
+    def __init__(self, fuzzy=None):
+        self._fuzzy = fuzzy
+        self.clear()
+
+    def __len__(self):
+        return len(self._entries) + len(self._frozen_entries)
+
+    def clear(self):
+        self._terms = []
+        self._added = set()
+        self._removed = set()
+        self._entries = {}
+        self._grams = {}
+        self._frozen_entries = {}
+        self._frozen_grams = {}
+        self._frozen = None
+        self._num_entries = 0
+        self._num_postings = 0
+        self._deletes = {}
+        self._num_deletes = 0
+
+    def flush(self):
+        """folds the terms added and removed since the last flush into the sorted array
+        """
+
+        if self._removed:
+            removed = self._removed
+            self._terms = [term for term in self._terms if term not in removed]
+            self._removed = set()
+        if self._added:
+
+            # the array and the sorted batch are two runs: the sort merges them in linear time
+
+            self._terms.extend(sorted(self._added))
+            self._terms.sort()
+            self._added = set()
+
+    def numDeletes(self):
+        return self._num_deletes
+
+    def memoryEstimate(self):
+        """rough size in bytes, counting terms, their entries, n-grams, n-gram postings and deletion variants. A restored
+        index keeps its untouched entries and postings packed, so this is an upper bound for it.
+        """
+
+        num_grams = len(self._grams) + len(self._frozen_grams)
+        return (len(self) * INDEX_TERM_MEMORY_ESTIMATE_BYTES + self._num_entries * INDEX_ENTRY_MEMORY_ESTIMATE_BYTES
+                + num_grams * INDEX_GRAM_MEMORY_ESTIMATE_BYTES + self._num_postings * INDEX_POSTING_MEMORY_ESTIMATE_BYTES
+                + self._num_deletes * FUZZY_DELETE_MEMORY_ESTIMATE_BYTES)
+
+    def restore(self, terms, labels, sorted_terms, entry_offsets, pairs, gram_names, gram_offsets, gram_ids):
+        """fills an empty index from cwkCorpusCache.packIndex arrays. sorted_terms become the sorted array; the
+        entries of sorted_terms[i] are the (labels id, number of files) pairs in pairs[entry_offsets[i]:entry_offsets[i + 1]],
+        and the terms of gram_names[i] are the terms ids in gram_ids[gram_offsets[i]:gram_offsets[i + 1]]
+        """
+
+        self.clear()
+        self._terms = sorted_terms
+        self._frozen = (terms, labels, entry_offsets, pairs, gram_offsets, gram_ids)
+        self._frozen_entries = dict(zip(sorted_terms, range(len(sorted_terms))))
+        self._frozen_grams = dict(zip(gram_names, range(len(gram_names))))
+        self._num_entries = len(pairs) // 2
+        self._num_postings = len(gram_ids)
+        if self._fuzzy is not None:
+            for term in sorted_terms:
+                self.addDeletes(term)
+
+    def termEntries(self, term):
+        """{filename: number of files} of the term, None if it isn't indexed
+        """
+
+        entries = self._entries.get(term)
+        if entries is None:
+            i = self._frozen_entries.get(term)
+            if i is not None:
+                # thawed entries are published before their packed slot goes, so that a reader that doesn't hold
+                # the corpus lock (saving the cache) always finds one of them
+
+                entries = self._entries.setdefault(term, self.frozenEntries(i))
+                self._frozen_entries.pop(term, None)
+        return entries
+
+    def frozenEntries(self, i):
+        terms, labels, entry_offsets, pairs, gram_offsets, gram_ids = self._frozen
+        start, end = entry_offsets[i], entry_offsets[i + 1]
+        return dict(zip(map(labels.__getitem__, pairs[start:end:2]), pairs[start + 1:end:2]))
+
+    def gramPosting(self, gram):
+        """the set of terms containing the gram, None if there is none
+        """
+
+        posting = self._grams.get(gram)
+        if posting is None:
+            i = self._frozen_grams.get(gram)
+            if i is not None:
+                posting = self._grams.setdefault(gram, set(self.frozenGramTerms(i)))
+                self._frozen_grams.pop(gram, None)
+        return posting
+
+    def frozenGramTerms(self, i):
+        terms, labels, entry_offsets, pairs, gram_offsets, gram_ids = self._frozen
+        return map(terms.__getitem__, gram_ids[gram_offsets[i]:gram_offsets[i + 1]])
+
+    def gramPostings(self):
+        """(gram, terms) pairs of every gram, read without thawing. The packed grams are listed first: one thawed
+        meanwhile is already among the thawed ones listed next.
+        """
+
+        frozen = list(self._frozen_grams.items())
+        postings = list(self._grams.items())
+        thawed = dict(postings)
+        return postings + [(gram, list(self.frozenGramTerms(i))) for gram, i in frozen if gram not in thawed]
+
+    def termGrams(self, term):
+        return set(term[i:i + n] for n in COMPLETION_INDEX_GRAM_SIZES for i in range(len(term) - n + 1))
+
+    def addTerm(self, term, filename):
+        """registers one file containing the term; filename is the label (or the synonym for dictionary rows)
+        """
+
+        entries = self.termEntries(term)
+        if entries is None:
+            entries = {}
+            self._entries[term] = entries
+            if term in self._removed:
+                self._removed.discard(term)
+            else:
+                self._added.add(term)
+            grams = self.termGrams(term)
+            for gram in grams:
+                posting = self.gramPosting(gram)
+                if posting is None:
+                    posting = self._grams[gram] = set()
+                posting.add(term)
+            self._num_postings += len(grams)
+            if self._fuzzy is not None:
+                self.addDeletes(term)
+        count = entries.get(filename, 0)
+        if not count:
+            self._num_entries += 1
+        entries[filename] = count + 1
+
+    def removeTerm(self, term, filename):
+        entries = self.termEntries(term)
+        if entries is None or filename not in entries:
+            return
+        entries[filename] -= 1
+        if entries[filename] > 0:
+            return
+        del entries[filename]
+        self._num_entries -= 1
+        if entries:
+            return
+
+        # last occurrence gone: drop the term from the sorted array (at the next flush) and the n-gram postings
+
+        del self._entries[term]
+        if term in self._added:
+            self._added.discard(term)
+        else:
+            self._removed.add(term)
+        for gram in self.termGrams(term):
+            posting = self.gramPosting(gram)
+            if posting is not None:
+                posting.discard(term)
+                self._num_postings -= 1
+                if not posting:
+                    del self._grams[gram]
+        if self._fuzzy is not None:
+            self.removeDeletes(term)
+
+    # most deletion variants belong to a single term: their posting is the term itself until a second one shares it
+
+    def addDeletes(self, term):
+        deletes = self._deletes
+        variants = self._fuzzy.deletes(self._fuzzy.key(term))
+        for variant in variants:
+            posting = deletes.get(variant)
+            if posting is None:
+                deletes[variant] = term
+            elif type(posting) is str:
+                if posting != term:
+                    deletes[variant] = {posting, term}
+            else:
+                posting.add(term)
+        self._num_deletes += len(variants)
+
+    def removeDeletes(self, term):
+        deletes = self._deletes
+        variants = self._fuzzy.deletes(self._fuzzy.key(term))
+        for variant in variants:
+            posting = deletes.get(variant)
+            if posting is None:
+                continue
+            if type(posting) is str:
+                if posting == term:
+                    del deletes[variant]
+                continue
+            posting.discard(term)
+            if len(posting) == 1:
+                deletes[variant] = posting.pop()
+        self._num_deletes -= len(variants)
+
+    def entries(self, term):
+        """filenames of the term in the index's order, read without thawing (packed entries first, see termEntries)
+        """
+
+        i = self._frozen_entries.get(term)
+        if i is not None:
+            return list(self.frozenEntries(i))
+        return list(self._entries.get(term) or ())
+
+    def prefixMatches(self, prefix):
+        self.flush()
+        terms = self._terms
+        i = bisect.bisect_left(terms, prefix)
+        while i < len(terms):
+            term = terms[i]
+            if not term.startswith(prefix):
+                break
+            yield term
+            i += 1
+
+    def infixMatches(self, word, limit):
+        """terms containing but not starting with the word, the smallest `limit` of them in sorted order
+        """
+
+        n = min(len(word), max(COMPLETION_INDEX_GRAM_SIZES))
+        postings = [self.gramPosting(word[i:i + n]) for i in range(len(word) - n + 1)]
+        if not postings or None in postings:
+            return []
+        candidates = list(min(postings, key=len))
+        return heapq.nsmallest(limit, (term for term in candidates if word in term and not term.startswith(word)))
+
+    def candidates(self, word):
+        """yields every matching term as (term, is_prefix_match): prefix matches first, then infix matches
+        """
+
+        if not word:
+            return
+        for term in self.prefixMatches(word):
+            yield term, True
+        n = min(len(word), max(COMPLETION_INDEX_GRAM_SIZES))
+        postings = [self.gramPosting(word[i:i + n]) for i in range(len(word) - n + 1)]
+        if not postings or None in postings:
+            return
+        for term in list(min(postings, key=len)):
+            if word in term and not term.startswith(word):
+                yield term, False
+
+    def fuzzyMatches(self, word):
+        """(distance, term) pairs of the terms with a prefix within the allowed distance of the whole word, found
+        through the deletion variants of the word's key. Empty without a fuzzy matcher or for words too short to
+        allow an edit.
+        """
+
+        fuzzy = self._fuzzy
+        if fuzzy is None:
+            return []
+        key = fuzzy.key(word)
+        measured = fuzzy.measured(word)
+        limit = fuzzy.limit(measured)
+        if limit < 1:
+            return []
+        matches = []
+        seen = set()
+        for variant in fuzzy.deletes(key, limit):
+            posting = self._deletes.get(variant)
+            if posting is None:
+                continue
+            for term in ((posting,) if type(posting) is str else posting):
+                if term in seen:
+                    continue
+                seen.add(term)
+                distance = fuzzy.prefixDistance(measured, fuzzy.measured(term), limit)
+                if distance <= limit:
+                    matches.append((distance, term))
+        return matches
+
+    def search(self, word, limit, accept=None):
+        """yields up to `limit` matching terms: prefix matches first, then infix matches
+        """
+
+        if not word or limit <= 0:
+            return
+        count = 0
+        for term in self.prefixMatches(word):
+            if accept is not None and not accept(term):
+                continue
+            yield term
+            count += 1
+            if count >= limit:
+                return
+        for term in self.infixMatches(word, len(self) if accept is not None else limit - count):
+            if accept is not None and not accept(term):
+                continue
+            yield term
+            count += 1
+            if count >= limit:
+                return
+
+
+class cwkSynonymIndex:
+    """thesaurus of the custom dictionaries: every keyword and synonym is interned once, and each keyword maps to
+    the ids of its synonyms (and each synonym back to its keywords) packed in arrays. A pair listed in several files
+    is stored once per file, so removing one file leaves the others' pairs in place.
+    """
+
+    def __init__(self):
+        self._names = []
+        self._name_ids = {}
+        self._synonyms = {}
+        self._keywords = {}
+        self._num_pairs = 0
+
+    def __len__(self):
+        return self._num_pairs
+
+    def nameId(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names.append(sys.intern(name))
+            self._name_ids[name] = name_id
+        return name_id
+
+    def add(self, keyword, synonym):
+        keyword_id, synonym_id = self.nameId(keyword), self.nameId(synonym)
+        self._synonyms.setdefault(keyword_id, array('I')).append(synonym_id)
+        self._keywords.setdefault(synonym_id, array('I')).append(keyword_id)
+        self._num_pairs += 1
+
+    def remove(self, keyword, synonym):
+        keyword_id, synonym_id = self._name_ids.get(keyword), self._name_ids.get(synonym)
+        if keyword_id is None or synonym_id is None:
+            return
+
+        # a pair that isn't indexed leaves the count alone
+
+        synonym_ids = self._synonyms.get(keyword_id)
+        if synonym_ids is None or synonym_id not in synonym_ids:
+            return
+        for links, key, value in ((self._synonyms, keyword_id, synonym_id), (self._keywords, synonym_id, keyword_id)):
+            ids = links[key]
+            ids.remove(value)
+            if not ids:
+                del links[key]
+        self._num_pairs -= 1
+
+    def names(self, links, name):
+        name_id = self._name_ids.get(name)
+        ids = links.get(name_id) if name_id is not None else None
+        if not ids:
+            return []
+        names = []
+        seen = set()
+        for i in ids:
+            if i not in seen:
+                seen.add(i)
+                names.append(self._names[i])
+        return names
+
+    def synonyms(self, keyword):
+        return self.names(self._synonyms, keyword)
+
+    def keywords(self, synonym):
+        """the keywords listing the given word as one of their synonyms
+        """
+
+        return self.names(self._keywords, synonym)
+
+
+class cwkCompletionCache:
+    """LRU cache of completion candidate lists keyed by (index generation, kind, prefix). Entries of an older
+    generation are dropped as soon as a newer one is stored. Least recently used entries are also dropped while
+    the cached lists hold more than max_candidates candidates in total (the newest entry is always kept).
+    """
+
+    def __init__(self, size, max_candidates=None):
+        self.size = size
+        self.max_candidates = max_candidates
+        self._entries = collections.OrderedDict()
+        self._generation = None
+        self._num_candidates = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._num_candidates = 0
 
-    @filename.setter
-    def filename(self, value):
-        self._filename = value
+    def numCandidates(self, value):
+        # exact entries are (candidates, truncated), fuzzy ones the list of matches
+
+        return len(value[0]) if type(value) is tuple else len(value)
+
+    def memoryEstimate(self):
+        return self._num_candidates * COMPLETION_CACHE_CANDIDATE_MEMORY_ESTIMATE_BYTES
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if key[0] != self._generation:
+            self.clear()
+            self._generation = key[0]
+        previous = self._entries.get(key)
+        if previous is not None:
+            self._num_candidates -= self.numCandidates(previous)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._num_candidates += self.numCandidates(value)
+        while len(self._entries) > self.size or (self.max_candidates is not None and self._num_candidates > self.max_candidates and len(self._entries) > 1):
+            self._num_candidates -= self.numCandidates(self._entries.popitem(last=False)[1])
 
 
 class cwkCorpus(cwkBase):
     def __init__(self):
-        self._words = []
-        self._keywords = []
         cwkBase.__init__(self)
+        self.manifest = cwkFileManifest()
+
+        # held while a batch of changes is applied and while completions are read
+
+        self.lock = threading.RLock()
+
+        # bumped on every change; completion results cached under an older generation are stale
+
+        self.generation = 0
+        self._completion_cache = cwkCompletionCache(self.completion_cache_size, COMPLETION_CACHE_CANDIDATE_LISTS * self.max_ranked_candidates)
+
+        # every distinct term is stored once; the completion indexes cover the distinct words and keywords
+
+        self._store = cwkTermStore()
+        self._word_index = self.completionIndex()
+        self._keyword_index = self.completionIndex()
+
+        # custom dictionary rows are also kept as a thesaurus: keyword -> synonyms and back
+
+        self._synonym_index = cwkSynonymIndex()
+
+        # base word -> {surface form: number of files}, for words folded by cwkKoreanNormalizer
+
+        self._variants = {}
 
     def clearCorpus(self):
-        self._words = []
-        self._keywords = []
+        self.manifest.clear()
+        self._store = cwkTermStore()
+        self._word_index = self.completionIndex()
+        self._keyword_index = self.completionIndex()
+        self._synonym_index = cwkSynonymIndex()
+        self._variants = {}
+
+    def completionIndex(self):
+        """an empty completion index, keeping deletion variants for fuzzy matches when fuzzy_completion is on
+        """
+
+        if not self.fuzzy_completion:
+            return cwkCompletionIndex()
+        return cwkCompletionIndex(cwkFuzzyMatcher(self.fuzzy_max_distance, self.fuzzy_korean_jamo))
 
     def numWords(self):
-        return  len(self._keywords) + len(self._words)
+        return self._store.numOccurrences()
 
-    def addWord(self, name, filename):
+    def numTerms(self):
+        return self._store.numTerms()
+
+    def termCount(self, name):
+        return self._store.termCount(name)
+
+    def memoryEstimate(self):
+        return (self._store.memoryEstimate() + self._word_index.memoryEstimate() + self._keyword_index.memoryEstimate()
+                + self._completion_cache.memoryEstimate())
+
+    def addWord(self, name, filename, path=None):
         if name.strip():
-            self._words.append(cwkWord(name, filename))
+            self._store.add(CORPUS_WORD, path or filename, name, filename)
 
-    def addKeyword(self, name, filename):
+    def addKeyword(self, name, filename, path=None):
         if name.strip():
-            self._keywords.append(cwkWord(name, filename))
+            self._store.add(CORPUS_KEYWORD, path or filename, name, filename)
 
-    def get_autocomplete_list(self, word):
-        autocomplete_list = []
-        word_list = []
-        seen = []
-        word_count = 0
+    def indexFor(self, kind):
+        return self._keyword_index if kind == CORPUS_KEYWORD else self._word_index
+
+    def commitFile(self, path):
+        """makes the words and keywords collected from the given file visible to completions
+        """
+
+        self.generation += 1
+        is_dictionary = self.isDictionaryFile(path)
+        for kind, name, filename in self._store.commit(path, self.fileMtime(path)):
+            if kind == CORPUS_VARIANT:
+                surfaces = self._variants.setdefault(filename, {})
+                surfaces[name] = surfaces.get(name, 0) + 1
+                continue
+            self.indexFor(kind).addTerm(name, filename)
+            if is_dictionary and kind == CORPUS_WORD:
+                self._synonym_index.add(name, filename)
+
+    def fileMtime(self, path):
+        entry = self.manifest.get(path)
+        if entry is not None:
+            return entry.mtime
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+
+    def addFileCounts(self, path, counts):
+        """merges the per-file result of cwkFileParser and commits the file
+        """
+
+        for kind, pairs in counts.items():
+            for (name, filename), count in pairs.items():
+                if name.strip():
+                    self._store.add(kind, path, name, filename, count)
+        self.commitFile(path)
+
+    def mergeFile(self, path, counts):
+        """replaces the words and keywords of the file with a cwkFileParser result (an error message leaves it empty)
+        """
+
+        self.removeFile(path)
+        if not isinstance(counts, str):
+            self.addFileCounts(path, counts)
+
+    def applyChanges(self, removed_files, results, manifest_updates):
+        """applies a batch of file changes, atomically with respect to completions up to CORPUS_ATOMIC_BATCH_FILES
+        files. A larger batch takes the lock once per file so that completions aren't held up by the whole batch.
+        """
+
+        if len(removed_files) + len(results) <= CORPUS_ATOMIC_BATCH_FILES:
+            with self.lock:
+                for path in removed_files:
+                    self.removeFile(path)
+                    self.manifest.remove(path)
+                for path, mtime, size, digest in manifest_updates:
+                    self.manifest.update(path, mtime, size, digest)
+                for path, counts in results:
+                    self.mergeFile(path, counts)
+                self.flushIndexes()
+            return
+
+        # the manifest entry of a file lands with its words
+
+        updates = {update[0]: update for update in manifest_updates}
+        for path in removed_files:
+            with self.lock:
+                self.removeFile(path)
+                self.manifest.remove(path)
+        for path, counts in results:
+            with self.lock:
+                self.mergeFile(path, counts)
+                update = updates.pop(path, None)
+                if update is not None:
+                    self.manifest.update(*update)
+        with self.lock:
+            for update in updates.values():
+                self.manifest.update(*update)
+            self.flushIndexes()
+
+    def isEmpty(self):
+        return not self._store.numTerms() and not self.manifest.paths()
+
+    def restore(self, files, store_state, index_states):
+        """fills an empty corpus from a corpus cache without replaying its files term by term. files are
+        (path, mtime, size, digest) manifest entries, store_state the arguments of cwkTermStore.restore and
+        index_states {kind: arguments} those of cwkCompletionIndex.restore.
+        """
+
+        with self.lock:
+            self.generation += 1
+            self._store.restore(*store_state)
+            for kind, state in index_states.items():
+                self.indexFor(kind).restore(*state)
+            for path, mtime, size, digest in files:
+                self.manifest.update(path, mtime, size, digest)
+                for name, base, count in self._store.fileTriples(CORPUS_VARIANT, path):
+                    surfaces = self._variants.setdefault(base, {})
+                    surfaces[name] = surfaces.get(name, 0) + 1
+                if self.isDictionaryFile(path):
+                    for name, synonym, count in self._store.fileTriples(CORPUS_WORD, path):
+                        self._synonym_index.add(name, synonym)
+
+    def flushIndexes(self):
+        """sorts the terms added by a batch of commits into the completion indexes
+        """
+
+        self._word_index.flush()
+        self._keyword_index.flush()
+
+    def removeFile(self, path):
+        """retracts every word and keyword collected from the given file
+        """
+
+        self.generation += 1
+        is_dictionary = self.isDictionaryFile(path)
+        for kind, name, filename in self._store.remove(path):
+            if kind == CORPUS_VARIANT:
+                surfaces = self._variants.get(filename, {})
+                surfaces[name] = surfaces.get(name, 1) - 1
+                if surfaces[name] <= 0:
+                    del surfaces[name]
+                    if not surfaces:
+                        self._variants.pop(filename, None)
+                continue
+            self.indexFor(kind).removeTerm(name, filename)
+            if is_dictionary and kind == CORPUS_WORD:
+                self._synonym_index.remove(name, filename)
+
+    def iterWords(self):
+        return self._store.iterPairs(CORPUS_WORD)
+
+    def variants(self, word):
+        """the surface forms folded into the word, most frequent first
+        """
+
+        with self.lock:
+            surfaces = list(self._variants.get(word, ()))
+        return sorted(surfaces, key=self._store.termCount, reverse=True)
+
+    def synonyms(self, word):
+        """the word's synonyms in the custom dictionaries followed by the keywords listing it as a synonym
+        """
+
+        with self.lock:
+            synonyms = self._synonym_index.synonyms(word)
+            return synonyms + [w for w in self._synonym_index.keywords(word) if w not in synonyms]
+
+    def iterKeywords(self):
+        return self._store.iterPairs(CORPUS_KEYWORD)
+
+    def get_autocomplete_list(self, word, view_words=None):
+        with self.lock:
+            return self.autocompleteList(word, view_words)
+
+    def rankedTerms(self, index, word, limit, accept, view_words):
+        """top `limit` matches by score, selected with a heap so a short prefix matching a huge share of the vocabulary
+        costs one pass over (at most max_ranked_candidates) candidates rather than a sort
+        """
+
+        score = self.termScorer(view_words)
+        candidates = self.matchingCandidates(index, word, accept)
+        return [term for term, is_prefix in heapq.nlargest(limit, candidates, key=score)]
+
+    def termScorer(self, view_words):
+        """the ranking score of a (term, is_prefix_match) candidate
+        """
 
-        # keywords first
+        now = time.time()
+        term_stats = self._store.termStats
+        view_words = view_words or ()
+
+        def score(candidate):
+            term, is_prefix = candidate
+            count, mtime = term_stats(term)
+            age_days = max(now - mtime, 0) / 86400.0 if mtime else float('inf')
+            value = RANK_FREQUENCY_WEIGHT * math.log1p(count) + RANK_RECENCY_WEIGHT * 0.5 ** (age_days / RANK_RECENCY_HALF_LIFE_DAYS)
+            if is_prefix:
+                value += RANK_PREFIX_BONUS
+            if term in view_words:
+                value += RANK_IN_VIEW_BONUS
+            return value
+
+        return score
+
+    def fuzzyTerms(self, index, word, limit, accept, view_words):
+        """up to `limit` terms within the fuzzy distance of the word that don't contain it (those are exact matches),
+        closest first and then by score (or alphabetically, unranked). Cached like the exact candidates.
+        """
+
+        cache = self._completion_cache
+        kind = CORPUS_KEYWORD if index is self._keyword_index else CORPUS_WORD
+        cached = cache.get((self.generation, 'fuzzy', kind, word))
+        if cached is None:
+            cached = [(distance, term) for distance, term in index.fuzzyMatches(word) if word not in term and (accept is None or accept(term))]
+            cache.put((self.generation, 'fuzzy', kind, word), cached)
+        if not self.rank_completions:
+            return [term for distance, term in heapq.nsmallest(limit, cached)]
+        score = self.termScorer(view_words)
+        return [term for distance, term in heapq.nsmallest(limit, cached, key=lambda match: (match[0], -score((match[1], False))))]
+
+    def matchingCandidates(self, index, word, accept):
+        """(term, is_prefix_match) candidates for the word, served from the completion cache when possible.
+        Every term containing the word also contains each of its prefixes, so a longer word is answered by filtering
+        the cached candidates of the longest cached shorter one, unless that list was cut at max_ranked_candidates.
+        """
 
-        for auto_word in self._keywords:
-            if word_count > self.max_autocomplete_suggestions:
+        cache = self._completion_cache
+        metrics = cwkMetrics.instance()
+        kind = CORPUS_KEYWORD if index is self._keyword_index else CORPUS_WORD
+        cached = cache.get((self.generation, kind, word))
+        if cached is not None:
+            metrics.count('completion_cache.hit')
+            return cached[0]
+        metrics.count('completion_cache.miss')
+
+        parent = None
+        for n in range(len(word) - 1, 0, -1):
+            parent = cache.get((self.generation, kind, word[:n]))
+            if parent is not None:
                 break
-            if word in auto_word.name:
-                if self.isCorpusFile(auto_word.filename) and auto_word.name in seen:
-                    continue
 
-                seen.append(auto_word.name)
-                if self.isCorpusFile(auto_word.filename):
-                    label = auto_word.name + '\t' + auto_word.filename
-                    str_to_insert = auto_word.name
+        if parent is not None and not parent[1]:
+            metrics.count('completion_cache.narrowed')
+            candidates = [(term, term.startswith(word)) for term, is_prefix in parent[0] if word in term]
+            truncated = False
+        else:
+            matches = index.candidates(word)
+            if accept is not None:
+                matches = (candidate for candidate in matches if accept(candidate[0]))
+            candidates = list(itertools.islice(matches, self.max_ranked_candidates + 1))
+            truncated = len(candidates) > self.max_ranked_candidates
+            if truncated:
+                candidates.pop()
+        cache.put((self.generation, kind, word), (candidates, truncated))
+        return candidates
+
+    def scriptFilter(self):
+        """None when every script is completed, else a check of the term's script tag against completion_scripts
+        """
+
+        mask = 0
+        for name in self.completion_scripts:
+            mask |= SCRIPT_NAMES.get(name, 0)
+        if not mask:
+            return None
+        term_scripts = self._store.termScripts
+        return lambda term: term_scripts(term) & mask
+
+    def wordFilter(self):
+        in_scripts = self.scriptFilter()
+        if in_scripts is None:
+            return self.isEndingOkay
+        return lambda term: self.isEndingOkay(term) and in_scripts(term)
+
+    def autocompleteList(self, word, view_words=None):
+        autocomplete_list = []
+        seen = set()
+        max_suggestions = self.max_autocomplete_suggestions
+
+        # keywords first, then the rest; within each, the best ranked (or, unranked, prefix matches before infix matches)
+
+        indexes = ((self._keyword_index, self.scriptFilter()), (self._word_index, self.wordFilter()))
+        for index, accept in indexes:
+            limit = max_suggestions - len(autocomplete_list)
+            if self.rank_completions:
+                names = self.rankedTerms(index, word, limit, accept, view_words)
+            else:
+                names = index.search(word, limit, accept)
+            if self.appendCompletions(autocomplete_list, seen, index, names):
+                return autocomplete_list
+
+        # room left: terms a typo or two away from the word
+
+        if self.fuzzy_completion:
+            for index, accept in indexes:
+                names = self.fuzzyTerms(index, word, max_suggestions - len(autocomplete_list), accept, view_words)
+                if self.appendCompletions(autocomplete_list, seen, index, names):
+                    return autocomplete_list
+
+        return autocomplete_list
+
+    def appendCompletions(self, autocomplete_list, seen, index, names):
+        """appends a (label, text to insert) row per file of each name; True once the list is full
+        """
+
+        max_suggestions = self.max_autocomplete_suggestions
+        for name in names:
+            for filename in index.entries(name):
+                if len(autocomplete_list) >= max_suggestions:
+                    break
+                if self.isCorpusFile(filename):
+                    if name in seen:
+                        continue
+                    seen.add(name)
+                    str_to_insert = name
                 else:
-                    label = auto_word.name + '\t' + auto_word.filename
-                    str_to_insert = auto_word.filename
+                    str_to_insert = filename
+                label = name + '\t' + filename
                 autocomplete_list.append((label, str_to_insert))
-                word_count += 1
+            if len(autocomplete_list) >= max_suggestions:
+                return True
+        return False
+
+
+class cwkTokenizer:
+    """single-pass streaming tokenizer: reads a file in large chunks cut at line boundaries (tokens never span lines)
+    and runs one combined pattern over each chunk, yielding the keywords and words found in it as batches
+    """
 
-        # the rest
+    _token_pattern = re.compile(CORPUS_TOKEN_REGEX)
+    _word_pattern = re.compile(WORD_REGEX)
 
-        for auto_word in self._words:
-            if word_count > self.max_autocomplete_suggestions:
+    def __init__(self, chunk_size=TOKENIZER_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def chunks(self, fh, timings=None):
+        """yields the text of the file cut at line boundaries. Time spent reading is added to timings['read']
+        """
+
+        tail = ''
+        while True:
+            started = time.perf_counter()
+            data = fh.read(self.chunk_size)
+            if timings is not None:
+                timings['read'] += time.perf_counter() - started
+            if not data:
                 break
-            if word in auto_word.name:
-                if self.isCorpusFile(auto_word.filename) and auto_word.name in seen:
-                    continue
-                if not self.isEndingOkay(auto_word.name):
-                    continue
+            cut = data.rfind('\n') + 1
+            if cut == 0:
+                tail += data
+                continue
+            yield tail + data[:cut]
+            tail = data[cut:]
+        if tail:
+            yield tail
 
-                seen.append(auto_word.name)
-                if self.isCorpusFile(auto_word.filename):
-                    label = auto_word.name + '\t' + auto_word.filename
-                    str_to_insert = auto_word.name
-                else:
-                    label = auto_word.name + '\t' + auto_word.filename
-                    str_to_insert = auto_word.filename
-                autocomplete_list.append((label, str_to_insert))
-                word_count += 1
+    def isWordLengthOkay(self, word):
+        return MIN_WORD_LEN < len(word) < MAX_WORD_LEN
 
-        return autocomplete_list
+    def batches(self, fh, timings=None):
+        """yields a (keywords, words) pair of Counters per chunk. Matches are counted first, so the per-token work
+        stays in C and the keyword/length checks run once per distinct token.
+        """
+
+        for text in self.chunks(fh, timings):
+            keywords = collections.Counter()
+            words = collections.Counter()
+            for token, count in collections.Counter(self._token_pattern.findall(text)).items():
+                if token.startswith('**'):
+                    keyword = token[2:-2]
+                    keywords[keyword] += count
+
+                    # a keyword match consumes its span: its words still count as words
+
+                    for word in self._word_pattern.findall(keyword):
+                        if self.isWordLengthOkay(word):
+                            words[word] += count
+                elif self.isWordLengthOkay(token):
+                    words[token] += count
+            yield keywords, words
+
+    def tokens(self, fh):
+        """yields (kind, token) pairs
+        """
+
+        for keywords, words in self.batches(fh):
+            for keyword, count in keywords.items():
+                for _ in range(count):
+                    yield CORPUS_KEYWORD, keyword
+            for word, count in words.items():
+                for _ in range(count):
+                    yield CORPUS_WORD, word
+
+
+class cwkSuffixTrie:
+    """trie of suffixes keyed by their characters read backwards, so that every suffix of a word found in it
+    is reported in one walk from the end of the word
+    """
+
+    _end = ''
+
+    def __init__(self, suffixes):
+        self._root = {}
+        for suffix in suffixes:
+            node = self._root
+            for char in reversed(suffix):
+                node = node.setdefault(char, {})
+            node[self._end] = True
+
+    def suffixLengths(self, word):
+        """lengths of the suffixes the word ends with, longest first
+        """
+
+        lengths = []
+        node = self._root
+        for i in range(len(word) - 1, -1, -1):
+            node = node.get(word[i])
+            if node is None:
+                break
+            if self._end in node:
+                lengths.append(len(word) - i)
+        lengths.reverse()
+        return lengths
+
+
+class cwkKoreanNormalizer:
+    """folds inflected Korean words (에반게리온은, 에반게리온을...) into their base form. Picklable, like cwkFileParser.
+    """
+
+    _trie = cwkSuffixTrie(KOREAN_JOSA + KOREAN_ENDINGS)
+    _scripts = cwkBase._scripts
+
+    def __init__(self, accept):
+        # accept: the length check every indexed word passes; a base failing it is not folded into
+
+        self.accept = accept
+
+    def candidates(self, word):
+        """possible bases of the word, longest suffix stripped first
+        """
+
+        if self._scripts.leading(word[-1]) != SCRIPT_HANGUL:
+            return []
+        return [word[:-length] for length in self._trie.suffixLengths(word) if length < len(word) and self.accept(word[:-length])]
+
+    def normalize(self, words):
+        """maps a Counter of words to (Counter of base words, {(surface, base): count})
+        """
+
+        candidates = {}
+        forms = collections.Counter()
+        batch = list(words)
+        for word, scripts in zip(batch, self._scripts.classify(batch)):
+            if not scripts & SCRIPT_HANGUL:
+                continue
+            bases = self.candidates(word)
+            if bases:
+                candidates[word] = bases
+                forms.update(set(bases))
+
+        base_counts = collections.Counter()
+        variants = {}
+        for word, count in words.items():
+            base = word
+            for candidate in candidates.get(word, ()):
+                if candidate in words or forms[candidate] >= 2:
+                    base = candidate
+                    break
+            base_counts[base] += count
+            if base != word:
+                variants[(word, base)] = count
+        return base_counts, variants
+
+
+class cwkFileParser:
+    """extracts keywords and words from a single corpus or dictionary file in one read.
+    It holds no sublime state so that it can be shipped to worker processes.
+    """
+
+    def __init__(self, corpus_extensions, custom_dictionary_extensions, normalize_korean_endings=False):
+        self.corpus_extensions = corpus_extensions
+        self.custom_dictionary_extensions = custom_dictionary_extensions
+        self.tokenizer = cwkTokenizer()
+        self.normalizer = cwkKoreanNormalizer(self.tokenizer.isWordLengthOkay) if normalize_korean_endings else None
+
+    def parseTimed(self, filename):
+        """parse() plus the seconds spent reading, tokenizing and normalizing the file, as a third element.
+        The timings travel with the result so that they survive worker processes.
+        """
+
+        timings = {'read': 0.0, 'tokenize': 0.0, 'normalize': 0.0}
+        filename, counts = self.parse(filename, timings)
+        return filename, counts, timings
+
+    def parse(self, filename, timings=None):
+        """returns (filename, {kind: {(name, label): count}}), or (filename, error message) if the file can't be read.
+        Variants are labelled with their base word rather than the file name.
+        """
+
+        fextension = os.path.splitext(filename)[1]
+        counts = dict((kind, {}) for kind in CORPUS_KINDS)
+        try:
+            if fextension in self.corpus_extensions:
+                basename = os.path.basename(filename)
+                keywords = collections.Counter()
+                words = collections.Counter()
+                started = time.perf_counter()
+                with open(filename, "r", encoding="utf-8") as fh:
+                    for keyword_batch, word_batch in self.tokenizer.batches(fh, timings):
+                        keywords.update(keyword_batch)
+                        words.update(word_batch)
+                if timings is not None:
+                    timings['tokenize'] += time.perf_counter() - started - timings['read']
+                    started = time.perf_counter()
+                if self.normalizer is not None:
+                    words, counts[CORPUS_VARIANT] = self.normalizer.normalize(words)
+                    if timings is not None:
+                        timings['normalize'] += time.perf_counter() - started
+                counts[CORPUS_KEYWORD] = dict(((name, basename), count) for name, count in keywords.items())
+                counts[CORPUS_WORD] = dict(((name, basename), count) for name, count in words.items())
+
+            elif fextension in self.custom_dictionary_extensions:
+                words = counts[CORPUS_WORD]
+                with open(filename, "r", encoding="utf-8") as fh:
+                    for line in fh:
+                        line = line.strip()
+                        if line.startswith(CUSTOM_DICTIONARY_COMMENT_CHAR): 
+                            continue
+                        elements = [w.strip() for w in line.split(',') if w != '']
+                        if elements:
+                            keyword = elements[0]
+                            for w in elements[1:]:
+                                key = (keyword, w)
+                                words[key] = words.get(key, 0) + 1
+        except (OSError, UnicodeDecodeError) as e:
+            return filename, "Error reading {filename}: {error}".format(filename=filename, error=e)
+        return filename, counts
+
+
+class cwkBinaryFile:
+    """little-endian encoding shared by the binary files: a magic(4s) version(H) itemsize(H) header, length-prefixed
+    utf-8 strings, string tables and arrays
+    """
+
+    _header = struct.Struct('<4sHH')
+
+    def packString(self, value):
+        data = value.encode('utf-8')
+        return struct.pack('<I', len(data)) + data
+
+    def unpackString(self, buf, offset):
+        length, = struct.unpack_from('<I', buf, offset)
+        offset += 4
+        return buf[offset:offset + length].decode('utf-8'), offset + length
+
+    def packArray(self, values):
+        if sys.byteorder != 'little':
+            values = array(values.typecode, values)
+            values.byteswap()
+        return values.tobytes()
+
+    def unpackArray(self, buf, offset, count, typecode='I'):
+        values = array(typecode)
+        end = offset + count * values.itemsize
+        values.frombytes(buf[offset:end])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values, end
+
+    def packStrings(self, values):
+        """count, character lengths and the utf-8 text of the strings joined, decoded in one go by unpackStrings
+        """
+
+        data = ''.join(values).encode('utf-8')
+        lengths = array('I', map(len, values))
+        return struct.pack('<I', len(lengths)) + self.packArray(lengths) + struct.pack('<I', len(data)) + data
+
+    def unpackStrings(self, buf, offset):
+        count, = struct.unpack_from('<I', buf, offset)
+        lengths, offset = self.unpackArray(buf, offset + 4, count)
+        size, = struct.unpack_from('<I', buf, offset)
+        offset += 4
+        text = buf[offset:offset + size].decode('utf-8')
+        ends = list(itertools.accumulate(lengths))
+        return list(map(text.__getitem__, map(slice, [0] + ends[:-1], ends))), offset + size
+
+
+
+class cwkCorpusCache(cwkBase, cwkBinaryFile):
+    """versioned binary cache of the corpus of one project folder: string tables of terms and labels followed by
+    the manifest entry and packed postings of every file under the folder, then the completion indexes of the
+    folder's words and keywords, so that an empty corpus is restored without rebuilding them term by term.
+
+    layout (little-endian):
+        header     magic(4s) version(H) itemsize(H)
+        terms      count(I) character lengths(count x I) byte length(I) utf-8 text
+        labels     count(I) character lengths(count x I) byte length(I) utf-8 text
+        term stats occurrence counts(terms x I) latest file mtimes(terms x d) script masks(terms x B)
+                   occurrences of words and keywords(Q)
+        files      count(I) then per file: path, mtime(d), size(Q), digest, and for words, keywords and variants
+                   n(I) followed by n (term id, label id, count) triples
+        indexes    for words, then keywords: n(I) term ids sorted by term(n x I), entry offsets(n + 1 x I) into
+                   (label id, number of files) pairs(I count, then the pairs), gram strings (as terms), gram offsets
+                   (grams + 1 x I) into term ids(I count, then the ids)
+    """
+
+    def __init__(self, folder):
+        cwkBase.__init__(self)
+        self.folder = folder
+        folder_digest = hashlib.md5(folder.encode('utf-8')).hexdigest()
+        self.cache_file_path = os.path.join(self.corpus_cache_dir, folder_digest + CORPUS_CACHE_EXTENSION)
+
+    def save(self, corpus):
+        """writes the part of the corpus collected from this folder; written to a temp file first and renamed
+        """
+
+        prefix = os.path.join(self.folder, '')
+        paths = sorted(path for path in corpus.manifest.paths() if path.startswith(prefix))
+
+        term_ids = {}
+        label_ids = {}
+        counts = array('I')
+        mtimes = array('d')
+        num_occurrences = 0
+
+        # per indexed kind: term id -> {label id: number of files}, as the completion index counts them
+
+        entries = dict((kind, {}) for kind in CORPUS_INDEXED_KINDS)
+        body = []
+        for path in paths:
+            entry = corpus.manifest.get(path)
+            if entry is None:
+                continue
+            body.append(self.packString(path))
+            body.append(struct.pack('<dQ', entry.mtime, entry.size))
+            body.append(self.packString(entry.digest))
+            for kind in CORPUS_KINDS:
+                triples = array('I')
+                kind_entries = entries.get(kind)
+                for term, label, count in corpus._store.fileTriples(kind, path):
+                    term_id = term_ids.get(term)
+                    if term_id is None:
+                        term_id = term_ids[term] = len(term_ids)
+                        counts.append(0)
+                        mtimes.append(0.0)
+                    label_id = label_ids.setdefault(label, len(label_ids))
+                    counts[term_id] += count
+                    if mtimes[term_id] < entry.mtime:
+                        mtimes[term_id] = entry.mtime
+                    if kind_entries is not None:
+                        num_occurrences += count
+                        files = kind_entries.setdefault(term_id, {})
+                        files[label_id] = files.get(label_id, 0) + 1
+                    triples.extend((term_id, label_id, count))
+                body.append(struct.pack('<I', len(triples) // 3))
+                body.append(self.packArray(triples))
+
+        terms = sorted(term_ids, key=term_ids.get)
+        scripts = bytes(corpus._store.termScripts(term) for term in terms)
+        chunks = [self._header.pack(CORPUS_CACHE_MAGIC, CORPUS_CACHE_VERSION, array('I').itemsize)]
+        chunks.append(self.packStrings(terms))
+        chunks.append(self.packStrings(sorted(label_ids, key=label_ids.get)))
+        chunks.append(self.packArray(counts))
+        chunks.append(self.packArray(array('d', mtimes)))
+        chunks.append(scripts)
+        chunks.append(struct.pack('<Q', num_occurrences))
+        chunks.append(struct.pack('<I', len(paths)))
+        chunks.extend(body)
+        for kind in CORPUS_INDEXED_KINDS:
+            chunks.extend(self.packIndex(terms, term_ids, label_ids, entries[kind], corpus.indexFor(kind)))
+
+        if not os.path.isdir(self.corpus_cache_dir):
+            os.makedirs(self.corpus_cache_dir)
+        tmp_path = self.cache_file_path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(b''.join(chunks))
+        os.replace(tmp_path, self.cache_file_path)
+        self.log("Saved corpus cache of {folder} to {path}".format(folder=self.folder, path=self.cache_file_path))
+
+    def packIndex(self, terms, term_ids, label_ids, entries, index):
+        """the folder's part of a completion index: its terms in order, their entries and their gram postings
+        """
+
+        sorted_ids = array('I', sorted(entries, key=terms.__getitem__))
+        entry_offsets = array('I', [0])
+        pairs = array('I')
+        for term_id in sorted_ids:
+
+            # in the index's order, which decides the file shown first for a corpus word
+
+            files = entries[term_id]
+            for label in index.entries(terms[term_id]):
+                label_id = label_ids.get(label)
+                if label_id in files:
+                    pairs.extend((label_id, files[label_id]))
+            entry_offsets.append(len(pairs))
+
+        # the index may hold other folders' terms too: keep the postings of this folder's terms only
+
+        gram_names = []
+        gram_offsets = array('I', [0])
+        gram_ids = array('I')
+        for gram, posting in index.gramPostings():
+            ids = [term_ids[term] for term in posting if term_ids.get(term) in entries]
+            if ids:
+                gram_names.append(gram)
+                gram_ids.extend(ids)
+                gram_offsets.append(len(gram_ids))
+
+        return [
+            struct.pack('<I', len(sorted_ids)), self.packArray(sorted_ids), self.packArray(entry_offsets),
+            struct.pack('<I', len(pairs)), self.packArray(pairs),
+            self.packStrings(gram_names), self.packArray(gram_offsets),
+            struct.pack('<I', len(gram_ids)), self.packArray(gram_ids),
+        ]
+
+    def load(self, corpus):
+        """restores the cached files of this folder into the corpus and its manifest; returns the number of files loaded
+        """
+
+        if not os.path.isfile(self.cache_file_path):
+            return 0
+        try:
+            with open(self.cache_file_path, "rb") as fh:
+                buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    return self.loadBuffer(corpus, buf)
+                finally:
+                    buf.close()
+        except (OSError, ValueError, struct.error, UnicodeDecodeError, IndexError) as e:
+            self.log("Ignoring unreadable corpus cache {path}: {error}".format(path=self.cache_file_path, error=e))
+            return 0
+
+    def loadBuffer(self, corpus, buf):
+        magic, version, itemsize = self._header.unpack_from(buf, 0)
+        if magic != CORPUS_CACHE_MAGIC or version != CORPUS_CACHE_VERSION or itemsize != array('I').itemsize:
+            self.log("Ignoring stale corpus cache {path}".format(path=self.cache_file_path))
+            return 0
+        offset = self._header.size
+        terms, offset = self.unpackStrings(buf, offset)
+        labels, offset = self.unpackStrings(buf, offset)
+        terms = list(map(sys.intern, terms))
+        labels = list(map(sys.intern, labels))
+        counts, offset = self.unpackArray(buf, offset, len(terms))
+        mtimes, offset = self.unpackArray(buf, offset, len(terms), 'd')
+        scripts = bytearray(buf[offset:offset + len(terms)])
+        offset += len(terms)
+        num_occurrences, num_files = struct.unpack_from('<QI', buf, offset)
+        offset += 12
+
+        files = []
+        postings = dict((kind, {}) for kind in CORPUS_KINDS)
+        for _ in range(num_files):
+            path, offset = self.unpackString(buf, offset)
+            mtime, size = struct.unpack_from('<dQ', buf, offset)
+            offset += 16
+            digest, offset = self.unpackString(buf, offset)
+            for kind in CORPUS_KINDS:
+                num_triples, = struct.unpack_from('<I', buf, offset)
+                triples, offset = self.unpackArray(buf, offset + 4, num_triples * 3)
+                if triples:
+                    postings[kind][path] = triples
+            files.append((path, mtime, size, digest))
+
+        if corpus.isEmpty():
+            # the indexes keep their own copy of the tables: the store reuses the slots of terms it drops
+
+            index_states = {}
+            frozen_terms, frozen_labels = tuple(terms), tuple(labels)
+            for kind in CORPUS_INDEXED_KINDS:
+                index_states[kind], offset = self.unpackIndex(buf, offset, frozen_terms, frozen_labels)
+            corpus.restore(files, (terms, labels, counts, mtimes, scripts, num_occurrences, postings), index_states)
+        else:
+            # another folder is already in the corpus: its ids differ, so the files are replayed into it
+
+            for path, mtime, size, digest in files:
+                for kind in CORPUS_KINDS:
+                    triples = postings[kind].get(path, ())
+                    for i in range(0, len(triples), 3):
+                        corpus._store.add(kind, path, terms[triples[i]], labels[triples[i + 1]], triples[i + 2])
+                corpus.manifest.update(path, mtime, size, digest)
+                corpus.commitFile(path)
+            corpus.flushIndexes()
+        self.log("Loaded {num} file(s) from corpus cache {path}".format(num=num_files, path=self.cache_file_path))
+        return num_files
+
+    def unpackIndex(self, buf, offset, terms, labels):
+        """the cwkCompletionIndex.restore arguments of one completion index, see packIndex
+        """
+
+        num_terms, = struct.unpack_from('<I', buf, offset)
+        sorted_ids, offset = self.unpackArray(buf, offset + 4, num_terms)
+        entry_offsets, offset = self.unpackArray(buf, offset, num_terms + 1)
+        num_pairs, = struct.unpack_from('<I', buf, offset)
+        pairs, offset = self.unpackArray(buf, offset + 4, num_pairs)
+        gram_names, offset = self.unpackStrings(buf, offset)
+        gram_offsets, offset = self.unpackArray(buf, offset, len(gram_names) + 1)
+        num_gram_ids, = struct.unpack_from('<I', buf, offset)
+        gram_ids, offset = self.unpackArray(buf, offset + 4, num_gram_ids)
+
+        sorted_terms = list(map(terms.__getitem__, sorted_ids))
+        return (terms, labels, sorted_terms, entry_offsets, pairs, gram_names, gram_offsets, gram_ids), offset
+
+
+class cwkKeywordStore(cwkBase, cwkBinaryFile):
+    """the keyword file: one "name<delimiter>filename" line per distinct keyword, sorted by name, behind a table of
+    line offsets. Prefix matches are found by binary search over the offsets, substring matches by one regex scan
+    of the text. A store is read once and shared until the file changes.
+
+    layout (little-endian):
+        header     magic(4s) version(H) itemsize(H)
+        delimiter  byte length(I) utf-8
+        lines      count(I) character offsets((count + 1) x I) utf-8 text of newline-terminated lines
+    """
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path):
+        """the store read from the given file, or None if there is none; reread only when the file has changed
+        """
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with cls._stores_lock:
+            store = cls._stores.get(path)
+            if store is None or store.stat != (st.st_mtime, st.st_size):
+                store = cls(path)
+                if not store.read():
+                    return None
+                store.stat = (st.st_mtime, st.st_size)
+                cls._stores[path] = store
+            return store
+
+    def __init__(self, path):
+        cwkBase.__init__(self)
+        self.path = path
+        self.stat = None
+        self.delimiter = ''
+        self.offsets = array('I', [0])
+        self.text = ''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def save(self, keywords, delimiter):
+        """writes the distinct names of the (name, filename) pairs, each with the first filename seen for it;
+        written to a temp file first and renamed
+        """
+
+        first_files = {}
+        for name, filename in keywords:
+            if name not in first_files:
+                first_files[name] = filename
+        lines = [name + delimiter + first_files[name] + "\n" for name in sorted(first_files)]
+
+        offsets = array('I', [0])
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+        chunks = [self._header.pack(KEYWORD_STORE_MAGIC, KEYWORD_STORE_VERSION, offsets.itemsize), self.packString(delimiter)]
+        chunks.append(struct.pack('<I', len(lines)))
+        chunks.append(self.packArray(offsets))
+        chunks.append(''.join(lines).encode('utf-8'))
+
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(b''.join(chunks))
+        os.replace(tmp_path, self.path)
+        self.log("Saved {num} keyword(s) to {path}".format(num=len(lines), path=self.path))
+
+    def read(self):
+        try:
+            with open(self.path, "rb") as fh:
+                buf = fh.read()
+            magic, version, itemsize = self._header.unpack_from(buf, 0)
+            if magic != KEYWORD_STORE_MAGIC or version != KEYWORD_STORE_VERSION or itemsize != array('I').itemsize:
+                self.log("Ignoring stale keyword file {path}".format(path=self.path))
+                return False
+            self.delimiter, offset = self.unpackString(buf, self._header.size)
+            count, = struct.unpack_from('<I', buf, offset)
+            self.offsets, offset = self.unpackArray(buf, offset + 4, count + 1)
+            self.text = buf[offset:].decode('utf-8')
+            if len(self.text) != self.offsets[-1]:
+                raise ValueError("truncated keyword file")
+        except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+            self.log("Ignoring unreadable keyword file {path}: {error}".format(path=self.path, error=e))
+            return False
+        return True
+
+    def name(self, i):
+        start = self.offsets[i]
+        return self.text[start:self.text.find(self.delimiter, start, self.offsets[i + 1])]
+
+    def lowerBound(self, key):
+        """index of the first line whose name is not less than the key
+        """
+
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lines(self, lo, hi):
+        return self.text[self.offsets[lo]:self.offsets[hi]].splitlines()
+
+    def matches(self, word):
+        """lines containing the word: those starting with it first, in name order, then the rest
+        """
+
+        if not word:
+            return self.lines(0, len(self))
+
+        # every name starting with the word sorts below the word followed by the highest code point
+
+        lo, hi = self.lowerBound(word), self.lowerBound(word + chr(sys.maxunicode))
+        found = self.lines(lo, hi)
+        text, offsets = self.text, self.offsets
+        pos = text.find(word)
+        while pos != -1:
+            i = bisect.bisect_right(offsets, pos) - 1
+            if not lo <= i < hi:
+                found.append(text[offsets[i]:offsets[i + 1] - 1])
+            pos = text.find(word, offsets[i + 1])
+        return found
+
+
+class cwkCancelToken:
+    """cooperative cancellation flag, checked by the collector between files
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
 
 
 class cwkWordsCollectorThread(cwkBase, threading.Thread):
-    def __init__(self, collector, open_folders):
+    def __init__(self, collector, open_folders, load_cache=False, changed_files=None, token=None, publish=None, on_done=None):
         self.collector = collector
         self.time_out_seconds = TIMEOUT_SECONDS
         self.open_folders = open_folders
+        self.load_cache = load_cache
+        self.changed_files = changed_files
+        self.token = token or cwkCancelToken()
+
+        # publish is given when the collector builds into a fresh corpus that completions can't see yet:
+        # it is called to swap that corpus in once it is consistent
+
+        self.publish = publish
+        self.on_done = on_done
         threading.Thread.__init__(self)
         cwkBase.__init__(self)
 
     def run(self):
-        files = []
-        for folder in self.open_folders:
-            # skip archives
-            if "/_" in folder:
-                self.log("Skipping the archived folder: {name}".format(name=folder))
-                continue
-            files = self.getWordFiles(folder)
-            num_files = len(files)
-            for filename in files:
-                if "/_" in filename:
-                    self.log("Skipping the archived file or folder: {name}".format(name=filename))
-                    num_files = num_files - 1
-                    continue
-                self.collectKeywords(filename)
-                self.collectWords(filename)
-        if files:
+        try:
+            self.collect()
+        finally:
+            if self.on_done is not None:
+                self.on_done(self)
+
+    def isLive(self):
+        return self.publish is None
+
+    def publishCorpus(self):
+        if self.publish is not None and not self.token.cancelled:
+            self.publish(self)
+            self.publish = None
+
+    def collect(self):
+        with cwkMetrics.instance().timer('build.total'):
+            self.collectCorpus()
+
+    def collectCorpus(self):
+        metrics = cwkMetrics.instance()
+
+        # restore the cached corpus first; the manifest diff below then validates it against the files on disk
+
+        if self.load_cache and self.persistent_corpus_cache:
+            num_restored = 0
+            for folder in self.open_folders:
+                if self.token.cancelled:
+                    return
+                with metrics.timer('build.cache_load'):
+                    num_loaded = cwkCorpusCache(folder).load(self.collector)
+                metrics.count('corpus_cache.hit' if num_loaded else 'corpus_cache.miss')
+                num_restored += num_loaded
+
+            # the restored corpus is consistent: serve it while it is being validated. Without a cache hit the
+            # fresh corpus stays private and files are merged into it as they are parsed, then swapped in at the end.
+
+            if num_restored:
+                self.publishCorpus()
+
+        # only files that were added, changed or deleted since the last build are (re)parsed
+
+        manifest = self.collector.manifest
+        if self.changed_files is None:
+            with metrics.timer('build.walk'):
+                files = self.getCorpusFiles(self.open_folders)
+            with metrics.timer('build.diff'):
+                changed_files, removed_files, manifest_updates = self.diffManifest(files)
+        else:
+            # the watcher already knows which files were touched: no need to walk the folders
 
-            # save keywords
+            files = [filename for filename in self.changed_files if os.path.isfile(filename)]
+            with metrics.timer('build.diff'):
+                changed_files, _, manifest_updates = self.diffManifest(files, prune=False)
+            removed_files = [filename for filename in self.changed_files if filename not in files and manifest.get(filename) is not None]
 
-            fh = codecs.open(self.keyword_file_path, "w", "utf-8")
-            self.log("Saving keywords to {}".format(self.keyword_file_path))
+        with metrics.timer('build.parse'):
+            results = self.collectFiles(changed_files)
+        if self.token.cancelled:
+            self.log("Corpus build cancelled")
+            return
 
-            seen = []
-            for kw in self.collector._keywords:
-                if kw.name in seen: 
-                    continue
-                seen.append(kw.name)
+        # a live corpus gets the batch under its lock; a fresh one already has the results
+
+        with metrics.timer('build.apply'):
+            self.collector.applyChanges(removed_files, results, manifest_updates)
+        self.publishCorpus()
+        num_files = len(manifest.paths())
+        metrics.count('build.files_parsed', len(changed_files))
+        metrics.count('build.files_removed', len(removed_files))
+        self.log("{changed} changed and {removed} removed corpus file(s)".format(changed=len(changed_files), removed=len(removed_files)))
+
+        if num_files:
+            keyword_file_path = self.keywordFilePath(self.open_folders)
+            if changed_files or removed_files or cwkKeywordStore.open(keyword_file_path) is None:
+
+                # save keywords
 
-                line_to_write = kw.name + self.keyword_file_delimiter + kw.filename + "\n"
-                fh.write(line_to_write)
-            fh.close()
+                try:
+                    with metrics.timer('build.keyword_file'):
+                        cwkKeywordStore(keyword_file_path).save(self.collector.iterKeywords(), self.keyword_file_delimiter)
+                except OSError as e:
+                    self.log("Error saving keywords to {path}: {error}".format(path=keyword_file_path, error=e))
+
+            if (changed_files or removed_files) and self.persistent_corpus_cache:
+                with metrics.timer('build.cache_save'):
+                    self.saveCorpusCache(changed_files + removed_files)
 
             self.log("{num_words} word(s) found in {num_files} corpus file(s)".format(num_words=self.collector.numWords(), num_files=num_files))
         else:
             self.log("No corpus file found.")
 
-    def stop(self):
-        if self.isAlive():
+    def saveCorpusCache(self, dirty_files):
+        """rewrites the cache of every open folder containing one of the given files
+        """
+
+        for folder in self.open_folders:
+            prefix = os.path.join(folder, '')
+            if any(filename.startswith(prefix) for filename in dirty_files):
+                try:
+                    cwkCorpusCache(folder).save(self.collector)
+                except OSError as e:
+                    self.log("Error saving corpus cache of {folder}: {error}".format(folder=folder, error=e))
+
+    def diffManifest(self, files, prune=True):
+        """compares the given files against the corpus manifest and returns (changed_files, removed_files, manifest_updates).
+        With prune, manifest entries not among the given files are reported as removed. The manifest entries of changed
+        files are returned rather than applied, so that they land together with the reparsed words.
+        """
+
+        manifest = self.collector.manifest
+        changed_files = []
+        manifest_updates = []
+        for filename in files:
+            if self.token.cancelled:
+                break
             try:
-                self._Thread__stop()
-            except AttributeError as e:
-                self.log("Thread error: {error}".format(error=e))
+                stat = os.stat(filename)
+                entry = manifest.get(filename)
+                if entry is not None and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+                    continue
+                digest = manifest.fileDigest(filename)
+            except OSError as e:
+                self.log("Error reading {filename}: {error}".format(filename=filename, error=e))
+                continue
+            if entry is not None and entry.digest == digest:
+                manifest.update(filename, stat.st_mtime, stat.st_size, digest)
+                continue
+            changed_files.append(filename)
+            manifest_updates.append((filename, stat.st_mtime, stat.st_size, digest))
+
+        if not prune:
+            return changed_files, [], manifest_updates
+        current_files = set(files)
+        removed_files = [path for path in manifest.paths() if path not in current_files]
+        return changed_files, removed_files, manifest_updates
+
+    def collectFiles(self, filenames):
+        """parses the given files, fanned out to a worker pool when corpus_build_workers > 1. Results are merged
+        into a fresh corpus as they arrive, or returned as a batch for a live one. Thread workers only overlap file
+        reads, as tokenizing holds the GIL; merging stays on this thread with either pool.
+        """
+
+        results = []
+        parser = cwkFileParser(self.corpus_extensions, self.custom_dictionary_extensions, self.normalize_korean_endings)
+        parse = parser.parseTimed if cwkMetrics.instance().enabled else parser.parse
+        workers = self.corpus_build_workers or multiprocessing.cpu_count()
+        if workers <= 1 or len(filenames) <= 1:
+            for filename in filenames:
+                if self.token.cancelled:
+                    break
+                self.collectResult(results, parse(filename))
+            return results
+
+        if self.corpus_build_pool == 'process':
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                    return self.collectFutures(results, executor, parse, filenames)
+            except (OSError, RuntimeError) as e:
+                self.log("Process pool unavailable, falling back to threads: {error}".format(error=e))
+                results = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return self.collectFutures(results, executor, parse, filenames)
+
+    def collectFutures(self, results, executor, parse, filenames):
+        futures = [executor.submit(parse, filename) for filename in filenames]
+        for future in futures:
+            if self.token.cancelled:
+                # drop the files not started yet so that leaving the executor doesn't wait for them
+
+                for pending in futures:
+                    pending.cancel()
+                break
+            self.collectResult(results, future.result())
+        return results
+
+    def collectResult(self, results, result):
+        filename, counts = result[:2]
+        if isinstance(counts, str):
+            self.log(counts)
+        metrics = cwkMetrics.instance()
+        if len(result) > 2:
+            for phase, seconds in result[2].items():
+                metrics.observe('build.' + phase, seconds)
+        if self.isLive():
+            results.append((filename, counts))
+        else:
+            with metrics.timer('build.merge'):
+                self.collector.mergeFile(filename, counts)
+
+
+class cwkBuildRequest:
+    """a pending corpus build; requests queued behind a running build are merged into one
+    """
+
+    def __init__(self, folders, full=False, load_cache=False, changed_files=None):
+        self.folders = list(folders)
+        self.full = full
+        self.load_cache = load_cache
+        self.changed_files = None if changed_files is None else set(changed_files)
+
+    def merge(self, other):
+        if self.changed_files is None or other.changed_files is None:
+            changed_files = None
+        else:
+            changed_files = self.changed_files | other.changed_files
+        return cwkBuildRequest(other.folders, self.full or other.full, self.load_cache or other.load_cache, changed_files)
+
+
+class cwkBuildScheduler(cwkBase):
+    """owns the corpus of one project folder set and schedules its builds single-flight: at most one collector runs
+    at a time and requests arriving meanwhile are coalesced into a single queued build. Full rebuilds go into a fresh
+    corpus which replaces `corpus` in one assignment when done; incremental builds apply their batch to the live corpus
+    under its lock. A file watcher on the folders feeds changed files in as incremental builds.
+    """
+
+    def __init__(self, folders, on_built=None):
+        cwkBase.__init__(self)
+        self.folders = list(folders)
+        self.corpus = cwkCorpus()
+        self.on_built = on_built
+        self._lock = threading.Lock()
+        self._collector_thread = None
+        self._watcher_thread = None
+        self._building = False
+        self._queued = None
+
+    def isBuilding(self):
+        return self._building
+
+    def isWatching(self):
+        return self._watcher_thread is not None and self._watcher_thread.is_alive()
+
+    def isWatchingEvents(self):
+        """True when inotify watches every folder, so that saves reach the index without a save hook
+        """
+
+        return self.isWatching() and self._watcher_thread.event_driven
+
+    def request(self, full=False, load_cache=False, changed_files=None):
+        build_request = cwkBuildRequest(self.folders, full, load_cache, changed_files)
+        with self._lock:
+            if self.isBuilding():
+                # a full rebuild makes whatever is running moot
+
+                if full:
+                    self._collector_thread.token.cancel()
+                self._queued = build_request if self._queued is None else self._queued.merge(build_request)
+                return
+            self.startBuild(build_request)
+
+    def cancel(self):
+        with self._lock:
+            self._queued = None
+            if self._collector_thread is not None:
+                self._collector_thread.token.cancel()
+
+    def close(self):
+        self.cancel()
+        self.watch(False)
+
+    def join(self):
+        """waits until the running and queued builds are done
+        """
+
+        while True:
+            thread = self._collector_thread
+            if thread is None:
+                return
+            thread.join()
+            with self._lock:
+                if self._collector_thread is thread and not self._building:
+                    return
+
+    def watch(self, enabled=True):
+        """starts or stops the background watcher that feeds changed corpus files to the collector
+        """
+
+        if enabled and self.folders:
+            if not self.isWatching():
+                self._watcher_thread = cwkFileWatcher(self.folders, self.onCorpusFilesChanged)
+                self._watcher_thread.start()
+        elif self._watcher_thread is not None:
+            self._watcher_thread.stop()
+            self._watcher_thread = None
+
+    def onCorpusFilesChanged(self, changed_files):
+        """watcher callback, runs on the watcher thread: reindexes just the touched files (None: rescan the folders)
+        """
+
+        self.request(changed_files=changed_files)
+
+    def startBuild(self, build_request):
+        fresh = build_request.full or build_request.load_cache
+        collector = cwkCorpus() if fresh else self.corpus
+        self.log("Starting {kind} corpus build".format(kind="full" if fresh else "incremental"))
+        self._building = True
+        self._collector_thread = cwkWordsCollectorThread(collector, build_request.folders, build_request.load_cache,
+                                                         build_request.changed_files, cwkCancelToken(),
+                                                         self.publish if fresh else None, self.buildDone)
+        self._collector_thread.start()
+
+    def publish(self, collector_thread):
+        with self._lock:
+            if not collector_thread.token.cancelled:
+                self.corpus = collector_thread.collector
+
+    def buildDone(self, collector_thread):
+        with self._lock:
+            if self._collector_thread is not collector_thread:
+                return
+            self._building = False
+            build_request = self._queued
+            self._queued = None
+            if build_request is not None:
+                self.startBuild(build_request)
+        if self.on_built is not None and build_request is None:
+            self.on_built(self)
+
+
+class cwkCorpusRegistry(cwkBase):
+    """independent corpus indexes keyed by project folder set. Past corpus_memory_budget_mb the least recently used
+    ones are evicted (never the most recent). Folders open in several projects share their on-disk cache file, since
+    cwkCorpusCache is keyed by folder.
+    """
+
+    def __init__(self):
+        cwkBase.__init__(self)
+        self._lock = threading.Lock()
+        self._schedulers = collections.OrderedDict()
+
+    def key(self, folders):
+        return tuple(sorted(folders))
+
+    def find(self, folders):
+        with self._lock:
+            scheduler = self._schedulers.get(self.key(folders))
+            if scheduler is not None:
+                self._schedulers.move_to_end(self.key(folders))
+            return scheduler
+
+    def open(self, folders):
+        """returns (scheduler, created) for the folder set; a created one still has to be built
+        """
+
+        key = self.key(folders)
+        with self._lock:
+            scheduler = self._schedulers.get(key)
+            if scheduler is not None:
+                self._schedulers.move_to_end(key)
+                return scheduler, False
+            scheduler = cwkBuildScheduler(folders, self.evict)
+            self._schedulers[key] = scheduler
+        self.evict()
+        return scheduler, True
+
+    def evict(self, *args):
+        budget = self.corpus_memory_budget_mb * 1024 * 1024
+        evicted = []
+        with self._lock:
+            sizes = [(key, scheduler.corpus.memoryEstimate()) for key, scheduler in self._schedulers.items()]
+            total = sum(size for key, size in sizes)
+            for key, size in sizes[:-1]:
+                if total <= budget:
+                    break
+                evicted.append(self._schedulers.pop(key))
+                total -= size
+                self.log("Evicted corpus of {folders} ({size} bytes)".format(folders=list(key), size=size))
+        for scheduler in evicted:
+            scheduler.close()
+
+    def close(self):
+        with self._lock:
+            schedulers = list(self._schedulers.values())
+            self._schedulers.clear()
+        for scheduler in schedulers:
+            scheduler.close()
+
+
+class cwkFileWatcher(cwkBase, threading.Thread):
+    """background watcher of the corpus and dictionary files in the given folders. Uses inotify on Linux and falls back
+    to polling file stats. Bursts of changes are coalesced until nothing changed for the debounce window; the callback
+    then receives the set of touched files, or None when only a full rescan can tell (e.g. a directory was moved away).
+    Once the watches are in place a rescan is requested, so that changes made while they were being set up aren't lost;
+    if a folder can't be watched (e.g. past the inotify watch limit), the watcher falls back to polling.
+    """
+
+    _event_header = struct.Struct('iIII')
+
+    def __init__(self, folders, callback):
+        cwkBase.__init__(self)
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.folders = list(folders)
+        self.callback = callback
+        self._stop_event = threading.Event()
+        self._pending = set()
+        self._needs_rescan = False
+        self._last_event = 0
+        self._inotify_fd = None
+        self._watches = {}
+        self._snapshot = {}
+        self.event_driven = False
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            if self.startInotify():
+                self.event_driven = True
+            else:
+                self.log("inotify unavailable, polling corpus files every {} second(s)".format(self.corpus_watch_poll_seconds))
+                self._snapshot = self.statFiles()
+
+            # files touched between the last walk of the folders and now have been missed
+
+            self.markChanged(None)
+            while not self._stop_event.is_set():
+                if self._inotify_fd is not None:
+                    self.readInotifyEvents()
+                else:
+                    self._stop_event.wait(self.corpus_watch_poll_seconds)
+                    self.pollFiles()
+                self.flushPending()
+        finally:
+            self.stopInotify()
+
+    def isWatchedFile(self, path):
+        name = os.path.basename(path)
+        return not name.startswith('.') and "/_" not in path and (self.isCorpusFile(path) or self.isDictionaryFile(path))
+
+    def markChanged(self, path):
+        if path is None:
+            self._needs_rescan = True
+        elif self.isWatchedFile(path):
+            self._pending.add(path)
+        else:
+            return
+        self._last_event = time.time()
 
-    def getWordFiles(self, folder, *args):
-        """resursive method parsing every corpus and dictionary file in the given folder and its subfolders
+    def flushPending(self):
+        """hands the coalesced changes over once the burst has settled
         """
 
-        autocomplete_word_files = []
-        folders = os.listdir(folder)
-        folders.sort(reverse=True)
-        for file in folders:
-            if file.startswith('.'):
-                continue
-            fullpath = os.path.join(folder, file)
+        if not (self._pending or self._needs_rescan):
+            return
+        if time.time() - self._last_event < self.corpus_watch_debounce_seconds:
+            return
+        changed_files = None if self._needs_rescan else self._pending
+        self._pending = set()
+        self._needs_rescan = False
+        self.log("Corpus files changed: {}".format("rescan" if changed_files is None else len(changed_files)))
+        self.callback(changed_files)
 
-            if os.path.isfile(fullpath) and (self.isCorpusFile(fullpath) or self.isDictionaryFile(fullpath)):
-                autocomplete_word_files.append(fullpath)
-            elif os.path.isdir(fullpath):
-                autocomplete_word_files += self.getWordFiles(fullpath, *args)
-        return autocomplete_word_files
+    # inotify
+
+    def startInotify(self):
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(INOTIFY_IN_NONBLOCK | INOTIFY_IN_CLOEXEC)
+        except (ImportError, OSError, AttributeError) as e:
+            self.log("inotify error: {error}".format(error=e))
+            return False
+        if fd < 0:
+            return False
+        self._libc = libc
+        self._get_errno = ctypes.get_errno
+        self._inotify_fd = fd
+        for folder in self.folders:
+            if "/_" not in folder and not self.addWatches(folder):
+                self.stopInotify()
+                return False
+        return True
+
+    def stopInotify(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        self._watches = {}
+        self.event_driven = False
 
-    def collectKeywords(self, filename):
-        file_lines = codecs.open(filename, "r", "utf-8")
+    def addWatches(self, folder):
+        """watches the folder and its subfolders, skipping hidden and archived ones. False when one of them can't be
+        watched: events from there would be missed
+        """
 
-        if self.isCorpusFile(filename):
+        if self._inotify_fd is None:
+            return False
+        wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(folder), INOTIFY_WATCH_MASK)
+        if wd < 0:
+            self.log("Can't watch {folder}: errno {errno}".format(folder=folder, errno=self._get_errno()))
+            return False
+        self._watches[wd] = folder
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return True
+        for name in names:
+            path = os.path.join(folder, name)
+            if not name.startswith(('.', '_')) and os.path.isdir(path) and not self.addWatches(path):
+                return False
+        return True
 
-            # extract keywords
-            pattern = re.compile(KEYWORD_REGEX)
-            for line in file_lines:
-                for m in re.findall(pattern, line):
+    def fallBackToPolling(self):
+        """switches to polling when inotify can't cover the folders any more, rescanning for what was missed
+        """
 
-                    self.collector.addKeyword(m, os.path.basename(filename))
+        self.log("Falling back to polling corpus files every {} second(s)".format(self.corpus_watch_poll_seconds))
+        self.stopInotify()
+        self._snapshot = self.statFiles()
+        self.markChanged(None)
 
-    def collectWords(self, filename):
-        file_lines = codecs.open(filename, "r", "utf-8")
+    def readInotifyEvents(self):
+        timeout = self.corpus_watch_debounce_seconds if (self._pending or self._needs_rescan) else 1.0
+        readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self._inotify_fd, 64 * 1024)
+        except OSError:
+            return
+        offset = 0
+        while offset + self._event_header.size <= len(data):
+            wd, mask, cookie, length = self._event_header.unpack_from(data, offset)
+            offset += self._event_header.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            self.handleInotifyEvent(wd, mask, name)
+
+    def handleInotifyEvent(self, wd, mask, name):
+        if mask & INOTIFY_IN_Q_OVERFLOW:
+            self.markChanged(None)
+            return
+        folder = self._watches.get(wd)
+        if folder is None:
+            return
+        if mask & INOTIFY_IN_IGNORED:
+            del self._watches[wd]
+            return
+        if mask & INOTIFY_IN_DELETE_SELF:
+            return
+        path = os.path.join(folder, name)
+        if mask & INOTIFY_IN_ISDIR:
+            if name.startswith(('.', '_')):
+                return
+            if mask & (INOTIFY_IN_CREATE | INOTIFY_IN_MOVED_TO):
+                # a new tree: watch it and pick up the files already in it
+
+                if not self.addWatches(path):
+                    self.fallBackToPolling()
+                    return
+                for filename in self.getWordFiles(path):
+                    self.markChanged(filename)
+            elif mask & INOTIFY_IN_MOVED_FROM:
+                self.markChanged(None)
+            return
+        if mask & (INOTIFY_IN_CLOSE_WRITE | INOTIFY_IN_MOVED_TO | INOTIFY_IN_MOVED_FROM | INOTIFY_IN_DELETE):
+            self.markChanged(path)
 
-        if self.isCorpusFile(filename):
+    # polling fallback
 
-            # english, korean, japanese regex patterns
-            pattern = re.compile(r'([\w가-힣一-龠あ-んア-ン]+)')
-            for line in file_lines:
-                for m in re.findall(pattern, line):
-                    if len(m) > MIN_WORD_LEN and len(m) < MAX_WORD_LEN:
-                        self.collector.addWord(m, os.path.basename(filename))
+    def statFiles(self):
+        snapshot = {}
+        for filename in self.getCorpusFiles(self.folders):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            snapshot[filename] = (stat.st_mtime, stat.st_size)
+        return snapshot
 
-        elif self.isDictionaryFile(filename):
-            for line in file_lines:
-                line = line.strip()
-                if line.startswith(CUSTOM_DICTIONARY_COMMENT_CHAR): 
-                    continue
-                words = [w.strip() for w in line.split(',') if w != '']
-                if words:
-                    keyword = words[0]
-                    words = words[1:]
-                    for w in words:
-                        self.collector.addWord(keyword, w)
+    def pollFiles(self):
+        snapshot = self.statFiles()
+        for filename, stat in snapshot.items():
+            if self._snapshot.get(filename) != stat:
+                self.markChanged(filename)
+        for filename in self._snapshot:
+            if filename not in snapshot:
+                self.markChanged(filename)
+        self._snapshot = snapshot
 
 
 class cwkWebDicParser(HTMLParser, cwkBase):
+    """parsers are fed the response as it streams in and set done once the target block is over,
+    so the rest of the page is never read
+    """
+
     def __init__(self, view):
         HTMLParser.__init__(self)
         cwkBase.__init__(self)
         self.view = view
+        self.done = False
+        self.parse_seconds = 0.0
+        self._status_at = 0
+
+    def feedStream(self, chunks):
+        """parses the byte chunks of a page until they run out or the target block ends
+        """
+
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            for chunk in chunks:
+                started = time.perf_counter()
+                self.feed(decoder.decode(chunk))
+                self.parse_seconds += time.perf_counter() - started
+                if self.done:
+                    break
+            else:
+                self.feed(decoder.decode(b'', final=True))
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        return self.getWordsFromWebDictionary()
+
+    def showStatus(self, message):
+        """status bar update, throttled to one every WEB_DIC_STATUS_INTERVAL_SECONDS
+        """
+
+        now = time.time()
+        if now - self._status_at >= WEB_DIC_STATUS_INTERVAL_SECONDS:
+            self._status_at = now
+            self.view.set_status('cwkWritingToolKit', message)
 
     def getWordsFromWebDictionary(self):
         return self._words
@@ -414,12 +3081,9 @@ class cwkEnglishWebDicParser(cwkWebDicParser):
 
             defs = data.split(",")
             self._words.append(self.synonym)
-            self.log("appending synonym: " + self.synonym)
-            self.view.set_status('cwkWritingToolKit', 'Add synonym: '+self.synonym)
             for d in defs:
                 self._words.append("\t {0}".format(d))
-                self.log("appending def: "+d)
-                self.view.set_status('cwkWritingToolKit', 'Adding definition: '+d)
+            self.showStatus('Add synonym: '+self.synonym)
             self.synonym = ''
             self.reset_tags()
         else:
@@ -443,6 +3107,8 @@ class cwkKoreanWebDicParser(cwkWebDicParser):
         self._is_in_block = False
 
     def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
         if tag == KOREAN_TARGET_BLOCK_TAG:
             for name, value in attrs:
                 if name == 'class' and value == KOREAN_TARGET_BLOCK_CLASS_ID:
@@ -450,8 +3116,11 @@ class cwkKoreanWebDicParser(cwkWebDicParser):
         if tag == KOREAN_TARGET_BLOCK_END_TAG:
             for name, value in attrs:
                 if name == 'class' and value == KOREAN_TARGET_BLOCK_END_CLASS_ID:
+                    # the synonyms end here: stop reading the page
+
                     self._is_in_block = False
                     self.reset_tags()
+                    self.done = True
 
         if self._is_in_block:
             if tag == KOREAN_TARGET_SYNONYM_TAG:
@@ -468,17 +3137,17 @@ class cwkKoreanWebDicParser(cwkWebDicParser):
         pass
 
     def handle_data(self, data):
+        if self.done:
+            return
         data = self.removeTags(data)
         if self._target_synonym_found:
             if self.isKorean(data):
                 self._words.append("\t" + data)
-                self.log("appending synonym: " + data)
-                self.view.set_status('cwkWritingToolKit', 'Adding synonym: '+data)
+                self.showStatus('Adding synonym: '+data)
 
         if self._target_keyword_tag_found:
             self._words.append(data)
-            self.log("appending keyword: " + data)
-            self.view.set_status('cwkWritingToolKit', 'Adding keyword: '+data)
+            self.showStatus('Adding keyword: '+data)
             self._target_keyword_tag_found = False
 
     def reset_tags(self):
@@ -486,6 +3155,479 @@ class cwkKoreanWebDicParser(cwkWebDicParser):
         self._target_keyword_tag_found = False
 
 
+class cwkHttpClient(cwkBase):
+    """HTTP/1.1 client shared by the web dictionary fetchers. Idle keep-alive connections are pooled per
+    (scheme, host, port), responses are requested gzip-compressed and decompressed as they stream in, and the
+    timeout bounds the whole request, retries included, instead of each socket operation.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """the client shared by every fetcher thread
+        """
+
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self):
+        cwkBase.__init__(self)
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def acquire(self, host_key, timeout):
+        """an idle pooled connection for the host, or a new one. The flag tells whether it was reused.
+        """
+
+        metrics = cwkMetrics.instance()
+        with self._lock:
+            idle = self._idle.get(host_key)
+            if idle:
+                metrics.count('http_pool.hit')
+                return idle.pop(), True
+        metrics.count('http_pool.miss')
+        scheme, host, port = host_key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def release(self, host_key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(host_key, [])
+            if len(idle) < self.http_max_connections_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def remaining(self, url, deadline):
+        left = deadline - time.time()
+        if left <= 0:
+            raise socket.timeout("timed out fetching {url}".format(url=url))
+        return left
+
+    def open(self, url, deadline):
+        """sends one GET and returns (host_key, conn, sock, response) with the headers read. Redirects are followed.
+        The socket is returned as well because the connection lets go of it once a response says it will close.
+        """
+
+        for _ in range(HTTP_MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            default_port = 443 if parts.scheme == 'https' else 80
+            host_key = (parts.scheme, parts.hostname, parts.port or default_port)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            headers = {
+                'Host': parts.netloc,
+                'User-Agent': HTTP_USER_AGENT.format(version=VERSION),
+                'Accept-Encoding': 'gzip',
+                'Connection': 'keep-alive',
+            }
+
+            # a pooled connection may have been closed by the server while idle: that failure is retried at once
+
+            while True:
+                conn, reused = self.acquire(host_key, self.remaining(url, deadline))
+                try:
+                    conn.timeout = self.remaining(url, deadline)
+                    if conn.sock is not None:
+                        conn.sock.settimeout(conn.timeout)
+                    conn.request('GET', path, headers=headers)
+                    sock = conn.sock
+                    response = conn.getresponse()
+                    break
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    if not reused:
+                        raise
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                response.read()
+                self.finish(host_key, conn, response)
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            return host_key, conn, sock, response
+        raise urllib.error.URLError("too many redirects fetching {url}".format(url=url))
+
+    def finish(self, host_key, conn, response):
+        if response.will_close:
+            conn.close()
+        else:
+            self.release(host_key, conn)
+
+    def chunks(self, url, timeout=TIMEOUT_SECONDS):
+        """yields the decompressed response body of a GET as it arrives. Failures before the first byte, and
+        statuses in HTTP_RETRY_STATUS, are retried http_retries times with exponential backoff.
+        A consumer that stops early closes the connection instead of returning it to the pool, unless the unread
+        rest of the body is short enough to drain.
+        """
+
+        deadline = time.time() + timeout
+        attempt = 0
+        while True:
+            try:
+                host_key, conn, sock, response = self.open(url, deadline)
+                if response.status in HTTP_RETRY_STATUS and attempt < self.http_retries:
+                    response.read()
+                    self.finish(host_key, conn, response)
+                    raise urllib.error.HTTPError(url, response.status, response.reason, response.msg, None)
+                break
+            except (urllib.error.HTTPError, http.client.HTTPException, OSError) as e:
+                if attempt >= self.http_retries:
+                    if isinstance(e, http.client.HTTPException):
+                        raise urllib.error.URLError(e)
+                    raise
+                delay = self.http_retry_backoff_seconds * (2 ** attempt)
+                attempt += 1
+                cwkMetrics.instance().count('http.retries')
+                self.log("Retrying {url} in {delay:.1f}s ({error})".format(url=url, delay=delay, error=e))
+                time.sleep(min(delay, self.remaining(url, deadline)))
+
+        if response.status >= 400:
+            response.read()
+            self.finish(host_key, conn, response)
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.msg, None)
+
+        decompressor = None
+        if (response.getheader('Content-Encoding') or '').lower() == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        complete = False
+        try:
+            while True:
+                sock.settimeout(self.remaining(url, deadline))
+                data = response.read(HTTP_CHUNK_SIZE)
+                if not data:
+                    break
+                if decompressor is not None:
+                    data = decompressor.decompress(data)
+                if data:
+                    yield data
+            if decompressor is not None:
+                data = decompressor.flush()
+                if data:
+                    yield data
+            complete = True
+        except http.client.HTTPException as e:
+            raise urllib.error.URLError(e)
+        finally:
+            # a consumer that stopped early leaves the body unread: a short rest is drained to keep the connection
+
+            if not complete and response.length is not None and response.length <= HTTP_DRAIN_LIMIT:
+                try:
+                    sock.settimeout(self.remaining(url, deadline))
+                    response.read()
+                    complete = True
+                except (http.client.HTTPException, OSError):
+                    pass
+            if complete:
+                self.finish(host_key, conn, response)
+            else:
+                conn.close()
+
+    def get(self, url, timeout=TIMEOUT_SECONDS):
+        """the whole decompressed response body of a GET
+        """
+
+        return b''.join(self.chunks(url, timeout))
+
+
+class cwkRateLimiter:
+    """spaces out calls from any number of threads to at most rate per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self, token=None):
+        """blocks until the next slot; False if the token was cancelled meanwhile
+        """
+
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        while True:
+            if token is not None and token.cancelled:
+                return False
+            left = slot - time.time()
+            if left <= 0:
+                return True
+            time.sleep(min(left, 0.1))
+
+
+class cwkWebDicCacheEntry:
+    def __init__(self, words, fetched_at):
+        self.words = words
+        self.fetched_at = fetched_at
+
+
+class cwkWebDicCache(cwkBase):
+    """persistent cache of web dictionary lookups keyed by (dictionary, normalized query).
+    Entries are appended to a JSON lines file (the last line for a key wins) and the file is compacted to the most
+    recently fetched web_dic_cache_max_entries entries once it holds twice that many lines.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """the cache shared by every fetcher thread
+        """
+
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self):
+        cwkBase.__init__(self)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._num_lines = 0
+        self._refreshing = set()
+
+    def key(self, dictionary, query):
+        return dictionary + "\t" + query.strip().lower()
+
+    def startRefresh(self, dictionary, query):
+        """claims the background refresh of a stale entry; False when one is already in flight
+        """
+
+        key = self.key(dictionary, query)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def endRefresh(self, dictionary, query):
+        with self._lock:
+            self._refreshing.discard(self.key(dictionary, query))
+
+    def isFresh(self, entry):
+        return time.time() - entry.fetched_at < self.web_dic_cache_ttl_hours * 3600
+
+    def get(self, dictionary, query):
+        """the cached entry, fresh or stale, or None
+        """
+
+        with self._lock:
+            self.load()
+            return self._entries.get(self.key(dictionary, query))
+
+    def put(self, dictionary, query, words):
+        entry = cwkWebDicCacheEntry(list(words), time.time())
+        key = self.key(dictionary, query)
+        with self._lock:
+            self.load()
+            self._entries[key] = entry
+            try:
+                self.append(key, entry)
+                if self._num_lines > 2 * self.web_dic_cache_max_entries:
+                    self.compact()
+            except OSError as e:
+                self.log("Error writing web dic cache {path}: {error}".format(path=self.web_dic_cache_path, error=e))
+
+    def load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        self._num_lines = 0
+        if not os.path.isfile(self.web_dic_cache_path):
+            return
+        with open(self.web_dic_cache_path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                self._num_lines += 1
+                try:
+                    record = json.loads(line)
+                    self._entries[record["k"]] = cwkWebDicCacheEntry(record["v"], record["t"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def append(self, key, entry):
+        if not os.path.isdir(os.path.dirname(self.web_dic_cache_path)):
+            os.makedirs(os.path.dirname(self.web_dic_cache_path))
+        with open(self.web_dic_cache_path, "a", encoding="utf-8") as fh:
+            fh.write(self.record(key, entry))
+        self._num_lines += 1
+
+    def record(self, key, entry):
+        return json.dumps({"k": key, "t": entry.fetched_at, "v": entry.words}, ensure_ascii=False) + "\n"
+
+    def compact(self):
+        """rewrites the file with the newest entries only, through a temp file and a rename
+        """
+
+        newest = heapq.nlargest(self.web_dic_cache_max_entries, self._entries.items(), key=lambda item: item[1].fetched_at)
+        self._entries = dict(newest)
+        tmp_path = self.web_dic_cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for key, entry in newest:
+                fh.write(self.record(key, entry))
+        os.replace(tmp_path, self.web_dic_cache_path)
+        self._num_lines = len(newest)
+        self.log("Compacted web dic cache to {num} entries".format(num=len(newest)))
+
+
+class cwkSpeechQueue(cwkBase, threading.Thread):
+    """background reader of words aloud through the speech_backend commands. Only the latest request is kept: a new
+    word replaces the queued one and stops the one being read, so speech never holds up a lookup or editing.
+    With speech_cache on, each (voice, word) is rendered once to an audio file and played from it afterwards.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """the queue shared by every command, started on first use
+        """
+
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.start()
+            return cls._instance
+
+    def __init__(self):
+        cwkBase.__init__(self)
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._condition = threading.Condition()
+        self._pending = None
+        self._speaking = None
+        self._process = None
+        self.backend = self.speechBackend()
+
+    def speechBackend(self):
+        """commands of the configured backend with the speech_command overrides, None when it cannot run here
+        """
+
+        backend = dict(SPEECH_BACKENDS.get(self.speech_backend, {}))
+        backend.update(self.speech_command)
+        if not backend.get('speak'):
+            self.log("Unknown speech backend: {backend}".format(backend=self.speech_backend))
+            return None
+        if shutil.which(backend['speak'][0]) is None:
+            self.log("Speech backend {backend} unavailable: {command} not found".format(backend=self.speech_backend, command=backend['speak'][0]))
+            return None
+
+        # a template that can't be filled in would otherwise fail on every word
+
+        fields = {'voice': "", 'text': "", 'file': ""}
+        for name in ('speak', 'render', 'play'):
+            try:
+                for arg in backend.get(name) or ():
+                    arg.format(**fields)
+            except (KeyError, IndexError, ValueError) as e:
+                self.log("Invalid {name} command of speech backend {backend}: {error!r}".format(name=name, backend=self.speech_backend, error=e))
+                return None
+        return backend
+
+    def say(self, word, voice):
+        if self.backend is None:
+            return
+        with self._condition:
+            if self._pending is None and self._speaking == (voice, word):
+                return
+            self._pending = (voice, word)
+            self.stopProcess()
+            self._condition.notify()
+
+    def isBusy(self):
+        return self._pending is not None or self._speaking is not None
+
+    def cancelUnless(self, word):
+        """drops the queued and current utterances unless they read the given word, e.g. the one at the cursor
+        """
+
+        with self._condition:
+            if self._pending is not None and self._pending[1] != word:
+                self._pending = None
+            if self._speaking is not None and self._speaking[1] != word:
+                self.stopProcess()
+
+    def stopProcess(self):
+        # callers hold self._condition
+
+        if self._process is not None and self._process.poll() is None:
+            try:
+                self._process.terminate()
+            except OSError:
+                pass
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                voice, word = self._speaking = self._pending
+                self._pending = None
+            try:
+                self.speak(voice, word)
+            except (OSError, subprocess.SubprocessError) as e:
+                self.log("Error reading aloud {word}: {error}".format(word=word, error=e))
+            except (KeyError, IndexError, ValueError) as e:
+                self.log("Invalid speech command reading aloud {word}: {error!r}".format(word=word, error=e))
+            finally:
+                with self._condition:
+                    self._speaking = None
+
+    def speak(self, voice, word):
+        fields = {'voice': voice or "", 'text': word}
+        if not (self.speech_cache and self.backend.get('render') and self.backend.get('play')):
+            self.runCommand(self.backend['speak'], fields)
+            return
+
+        path = self.cachePath(voice, word)
+        if not os.path.isfile(path):
+            if not os.path.isdir(self.speech_cache_dir):
+                os.makedirs(self.speech_cache_dir)
+
+            # an interrupted render leaves only the partial file behind
+
+            fields['file'] = part_path = path + ".part" + self.backend.get('extension', "")
+            if not self.runCommand(self.backend['render'], fields):
+                if os.path.isfile(part_path):
+                    os.remove(part_path)
+                return
+            os.replace(part_path, path)
+        fields['file'] = path
+        self.runCommand(self.backend['play'], fields)
+
+    def cachePath(self, voice, word):
+        key = "\0".join((self.speech_backend, voice or "", word)).encode('utf-8')
+        return os.path.join(self.speech_cache_dir, hashlib.md5(key).hexdigest() + self.backend.get('extension', ""))
+
+    def runCommand(self, template, fields):
+        """runs the command unless a newer request arrived. True when it ran to completion
+        """
+
+        with self._condition:
+            if self._pending is not None:
+                return False
+            process = self._process = subprocess.Popen([arg.format(**fields) for arg in template], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            return process.wait() == 0
+        finally:
+            with self._condition:
+                self._process = None
+
+
 class CwkWebDicFetcherThread(cwkBase, threading.Thread):
 
     def __init__(self, search_keyword, window, view, force_mode):
@@ -494,108 +3636,343 @@ class CwkWebDicFetcherThread(cwkBase, threading.Thread):
         self.window = window
         self.view = view
         self.timeout_seconds = TIMEOUT_SECONDS
-        self._query_depth = 0
         self._words = []
         self.force_mode = force_mode
+        self.token = cwkCancelToken()
+        self._shown = 0
+        self._shown_at = 0
+        self._snapshot = 0
+        self._open_panel = None
+        self._selected = 0
+        self._panel_closed = False
         threading.Thread.__init__(self)
 
     def run(self):
         if self.search_keyword:
             self.view.set_status('cwkWritingToolKit', 'Starting web dic thread')
+
+            # synonyms from the custom dictionaries need no network: they are listed (and shown) first
+
+            self._words = self.localSynonyms(self.search_keyword)
+            self.showProgress()
             if self.force_mode == 'Korean':
-                self._words = []
                 self.fetchKoreanSynonyms(self.search_keyword)
             elif self.force_mode == 'English':
-                encoded_query = urllib.parse.quote(self.search_keyword)
-                options = WEB_ENGLISH_DIC_OPTIONS.format(query=encoded_query)
-                request = urllib.request.Request(WEB_ENGLISH_DIC_URL % options)
-                response = urllib.request.urlopen(request)
-                webpage = response.read().decode('utf-8')
-
-                parser = cwkEnglishWebDicParser(self.view)
-
-                parser.feed(webpage)
-                self._words = parser.getWordsFromWebDictionary()
+                self._words += self.fetchWords('English', self.search_keyword)
             elif self.force_mode == 'Japanese':
                 self.log("Feature not implemented yet.")
             else:
                 if self.isEnglish(self.search_keyword):
-                    encoded_query = urllib.parse.quote(self.search_keyword)
-                    options = WEB_ENGLISH_DIC_OPTIONS.format(query=encoded_query)
-                    request = urllib.request.Request(WEB_ENGLISH_DIC_URL % options)
-                    response = urllib.request.urlopen(request)
-                    webpage = response.read().decode('utf-8')
-
-                    parser = cwkEnglishWebDicParser(self.view)
-
-                    parser.feed(webpage)
-                    self._words = parser.getWordsFromWebDictionary()
+                    self._words += self.fetchWords('English', self.search_keyword)
 
                 elif self.isKorean(self.search_keyword):
-                    self._words = []
                     self.fetchKoreanSynonyms(self.search_keyword)
                 elif self.isJapanese(self.search_keyword):
                     self.log("Feature not implemented yet.")
+            if self.token.cancelled:
+                return
             log_message = "{num} synonym(s) found for '{word}'".format(num=len(self._words), word=self.search_keyword)
             self.log(log_message)
             self.view.set_status('cwkWritingToolKit', log_message)
-            if self._words:
+            if self._words and len(self._words) != self._shown and not self._panel_closed:
                 self.showWebDic()
 
-    def showWebDic(self):
+    def showProgress(self):
+        """progressive display: the quick panel opens as soon as the first page is parsed and is re-shown with
+        the merged list at most every web_dic_progress_interval_seconds while the crawl goes on.
+        """
 
-        if self.web_dic_display_method == 'popup':
-            self.view.show_popup_menu(self._words, self.replaceSelectedWord)
-        elif self.web_dic_display_method == 'quick_panel':
-            self.window.show_quick_panel(self._words, self.replaceSelectedWord)
+        if not self.web_dic_progressive_display or self.web_dic_display_method != 'quick_panel':
+            return
+        if self.token.cancelled or self._panel_closed or len(self._words) == self._shown:
+            return
+        if self._shown and time.time() - self._shown_at < self.web_dic_progress_interval_seconds:
+            return
+        self.view.set_status('cwkWritingToolKit', "{num} synonym(s) found so far for '{word}'".format(num=len(self._words), word=self.search_keyword))
+        self.showWebDic()
+
+    def localSynonyms(self, word):
+        """the word and its synonyms in the custom dictionaries of the window's corpus, listed like a dictionary page
+        """
+
+        word = word.strip()
+        if not self.local_synonyms or self.window is None:
+            return []
+        scheduler = CwkAutoComplete.registry().find(self.window.folders())
+        if scheduler is None:
+            return []
+        synonyms = scheduler.corpus.synonyms(word)
+        if not synonyms:
+            return []
+        self.log("{num} local synonym(s) for {word}".format(num=len(synonyms), word=word))
+        return [word] + ["\t" + synonym for synonym in synonyms]
+
+    def fetchWords(self, dictionary, word):
+        """words parsed from one dictionary page, served from the lookup cache when possible.
+        A stale entry is returned right away and refreshed in the background (stale-while-revalidate), and is
+        also the fallback when the dictionary can't be reached.
+        """
+
+        metrics = cwkMetrics.instance()
+        cache = cwkWebDicCache.instance() if self.web_dic_cache else None
+        entry = cache.get(dictionary, word) if cache is not None else None
+        if entry is not None:
+            if cache.isFresh(entry):
+                metrics.count('web_dic_cache.hit')
+                return list(entry.words)
+            if self.web_dic_cache_stale_while_revalidate:
+                metrics.count('web_dic_cache.stale')
+
+                # repeated lookups of the same stale entry share one refresh
+
+                if cache.startRefresh(dictionary, word):
+                    threading.Thread(target=self.refreshWords, args=(dictionary, word)).start()
+                return list(entry.words)
+        if cache is not None:
+            metrics.count('web_dic_cache.miss')
+        try:
+            words = self.downloadWords(dictionary, word)
+        except (urllib.error.URLError, socket.timeout, OSError) as e:
+            metrics.count('web_dic.failed_requests')
+            self.log("Web dic lookup failed for {word}: {error}".format(word=word.strip(), error=e))
+            return list(entry.words) if entry is not None else []
+        if cache is not None:
+            cache.put(dictionary, word, words)
+        return words
+
+    def refreshWords(self, dictionary, word):
+        cache = cwkWebDicCache.instance()
+        try:
+            cache.put(dictionary, word, self.downloadWords(dictionary, word))
+        except (urllib.error.URLError, socket.timeout, OSError) as e:
+            self.log("Web dic refresh failed for {word}: {error}".format(word=word.strip(), error=e))
+        finally:
+            cache.endRefresh(dictionary, word)
+
+    def downloadWords(self, dictionary, word):
+        if dictionary == 'Korean':
+            url, options, parser = self.korean_dic_url, WEB_KOREAN_DIC_OPTIONS, cwkKoreanWebDicParser(self.view)
         else:
-            self.log("Unknown web dic display method: {}".format(self.web_dic_display_method))
+            url, options, parser = self.english_dic_url, WEB_ENGLISH_DIC_OPTIONS, cwkEnglishWebDicParser(self.view)
 
-    def fetchKoreanSynonyms(self, word):
-        """resursively fetches synonyms until _query_depth > MAX_QUERY_DEPTH
+        metrics = cwkMetrics.instance()
+        started = time.perf_counter()
+        encoded_query = urllib.parse.quote(word.strip())
+        chunks = cwkHttpClient.instance().chunks(url % options.format(query=encoded_query), self.timeout_seconds)
+        words = parser.feedStream(chunks)
+
+        # fetching and parsing interleave as the page streams in; the parser keeps its own share
+
+        elapsed = time.perf_counter() - started
+        metrics.observe('web_dic.request', elapsed)
+        metrics.observe('web_dic.fetch', elapsed - parser.parse_seconds)
+        metrics.observe('web_dic.parse', parser.parse_seconds)
+        return words
+
+    def showWebDic(self):
+        """shows a snapshot of the words found so far. The panel is opened on the main thread, and a snapshot
+        superseded by a newer one before it got there is dropped.
         """
 
-        self._query_depth += 1
+        words = list(self._words)
+        self._shown = len(words)
+        self._shown_at = time.time()
+        self._snapshot += 1
+        snapshot = self._snapshot
+        sublime.set_timeout(lambda: self.openWebDic(words, snapshot), 0)
 
-        if self._query_depth > MAX_QUERY_DEPTH: 
+    def openWebDic(self, words, snapshot):
+        if snapshot != self._snapshot or self.token.cancelled or self._panel_closed:
             return
 
-        encoded_query = urllib.parse.quote(word)
-        options = WEB_KOREAN_DIC_OPTIONS.format(query=encoded_query)
-        request = urllib.request.Request(WEB_KOREAN_DIC_URL % options)
+        # re-showing the panel closes the one on screen, which reports -1: only the latest panel's callback counts
+
+        self._open_panel = snapshot
+        on_done = lambda index: self.replaceSelectedWord(index, words, snapshot)
+        if self.web_dic_display_method == 'popup':
+            self.view.show_popup_menu(words, on_done)
+        elif self.web_dic_display_method == 'quick_panel':
+            self.window.show_quick_panel(words, on_done, 0, min(self._selected, len(words) - 1), self.highlightWord)
+        else:
+            self.log("Unknown web dic display method: {}".format(self.web_dic_display_method))
 
-        response = urllib.request.urlopen(request)
-        webpage = response.read().decode('utf-8')
+    def highlightWord(self, index):
+        if index >= 0:
+            self._selected = index
 
-        parser = cwkKoreanWebDicParser(self.view)
+    def fetchKoreanSynonyms(self, word):
+        """breadth-first synonym expansion: every level of the frontier is fetched concurrently on a bounded pool,
+        so the crawl takes about korean_synonym_max_depth round-trips. Words already queried are never queried again,
+        and the crawl stops at korean_synonym_max_requests requests or korean_synonym_deadline_seconds.
+        """
 
-        parser.feed(webpage)
-        for s in parser.getWordsFromWebDictionary():
-            if s not in self._words:
-                self._words.append(s)
+        deadline = time.time() + self.korean_synonym_deadline_seconds
+        requests_left = self.korean_synonym_max_requests
+        seen = set(self._words)
+        visited = set()
+        frontier = [word.strip()]
 
-        for s in parser.getWordsFromWebDictionary():
-            if s.startswith("\t"):
-                self.fetchKoreanSynonyms(s)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.korean_synonym_workers))
+        try:
+            for depth in range(self.korean_synonym_max_depth):
+                if self.token.cancelled:
+                    return
+                level = []
+                for w in frontier:
+                    if w and w not in visited and len(level) < requests_left:
+                        visited.add(w)
+                        level.append(w)
+                if not level:
+                    break
+                requests_left -= len(level)
+
+                # results are merged in frontier order so the list reads the same however the requests finish
+
+                futures = [executor.submit(self.fetchWords, 'Korean', w) for w in level]
+                frontier = []
+                for future in futures:
+                    if self.token.cancelled:
+                        for pending in futures:
+                            pending.cancel()
+                        return
+                    try:
+                        words = future.result(timeout=max(deadline - time.time(), 0))
+                    except concurrent.futures.TimeoutError:
+                        self.log("Korean synonym crawl hit its deadline at depth {depth}".format(depth=depth + 1))
+                        for pending in futures:
+                            pending.cancel()
+                        return
+                    except (urllib.error.URLError, socket.timeout, OSError) as e:
+                        self.log("Web dic lookup failed: {error}".format(error=e))
+                        continue
+                    for s in words:
+                        if s not in seen:
+                            seen.add(s)
+                            self._words.append(s)
+                        if s.startswith("\t"):
+                            frontier.append(s.strip())
+                    self.showProgress()
+        finally:
+            executor.shutdown(wait=False)
 
     def stop(self):
-        if self.isAlive():
-            self._Thread__stop()
+        """supersedes this lookup: the crawl stops before its next page and nothing more is shown
+        """
+        self.token.cancel()
 
-    def replaceSelectedWord(self, index):
+    def replaceSelectedWord(self, index, words=None, snapshot=None):
         """showWebDic callback method
         """
+
+        if snapshot is not None and snapshot != self._open_panel:
+            return
+        self._panel_closed = True
+
         # if the use canceled out of the selection menu, -1 is returned. Otherwise the index is returned.
 
         if index == -1: 
             return
 
-        selected_string = self._words[index]
+        selected_string = (words if words is not None else self._words)[index]
 
         # run Text Command cwk_insert_selected_text to replace the current word with the user's choice
 
         self.view.run_command("cwk_insert_selected_text", {"args": {'text': selected_string.strip()} }, text_type='keyword')
 
+class cwkWebDicPrefetchThread(CwkWebDicFetcherThread):
+    """fetches the dictionary pages of many words into the lookup cache, web_dic_prefetch_workers at a time and
+    at most web_dic_prefetch_rate requests per second. Korean synonyms are followed breadth-first as deep as a
+    lookup would go, so later lookups are served from the cache. Every page is cached as soon as it is fetched and
+    fresh entries are skipped, so a run that was cancelled or cut short resumes where it stopped when started again.
+    """
+
+    def __init__(self, terms, window, view):
+        CwkWebDicFetcherThread.__init__(self, '', window, view, False)
+        self.terms = terms
+        self.limiter = cwkRateLimiter(self.web_dic_prefetch_rate)
+        self.done = 0
+        self.cached = 0
+        self.failed = 0
+        self.total = 0
+
+    def dictionaryFor(self, word):
+        if self.isEnglish(word):
+            return 'English'
+        if self.isKorean(word):
+            return 'Korean'
+        return None
+
+    def run(self):
+        cache = cwkWebDicCache.instance()
+        requests_left = self.web_dic_prefetch_max_requests
+        visited = set()
+        level = []
+        for word in self.terms:
+            dictionary = self.dictionaryFor(word)
+            if dictionary is not None and word not in visited:
+                visited.add(word)
+                level.append((dictionary, word))
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.web_dic_prefetch_workers))
+        try:
+            for depth in range(self.korean_synonym_max_depth):
+                level = level[:requests_left]
+                if not level or self.token.cancelled:
+                    break
+                requests_left -= len(level)
+                self.total += len(level)
+                futures = [executor.submit(self.prefetchWords, cache, dictionary, word) for dictionary, word in level]
+                frontier = []
+                for future in concurrent.futures.as_completed(futures):
+                    dictionary, words, status = future.result()
+                    if status == 'cancelled':
+                        continue
+                    self.done += 1
+                    if status == 'cached':
+                        self.cached += 1
+                    elif status == 'failed':
+                        self.failed += 1
+                    self.showProgress()
+                    if dictionary != 'Korean':
+                        continue
+                    for s in words:
+                        synonym = s.strip()
+                        if s.startswith("\t") and synonym not in visited:
+                            visited.add(synonym)
+                            frontier.append(('Korean', synonym))
+                level = frontier
+        finally:
+            executor.shutdown(wait=not self.token.cancelled)
+
+        state = "cancelled" if self.token.cancelled else "done"
+        message = "Web dic prefetch {state}: {done} word(s), {cached} already cached, {failed} failed".format(
+            state=state, done=self.done, cached=self.cached, failed=self.failed)
+        self.log(message)
+        self.view.erase_status('cwkWritingToolKit')
+        sublime.status_message(message)
+
+    def prefetchWords(self, cache, dictionary, word):
+        """(dictionary, words, status) where status is one of cached, fetched, failed or cancelled
+        """
+
+        entry = cache.get(dictionary, word)
+        if entry is not None and cache.isFresh(entry):
+            return dictionary, entry.words, 'cached'
+        if not self.limiter.wait(self.token):
+            return dictionary, [], 'cancelled'
+        try:
+            words = self.downloadWords(dictionary, word)
+        except (urllib.error.URLError, socket.timeout, OSError) as e:
+            self.log("Web dic prefetch failed for {word}: {error}".format(word=word, error=e))
+            return dictionary, [], 'failed'
+        cache.put(dictionary, word, words)
+        return dictionary, words, 'fetched'
+
+    def showProgress(self):
+        self.view.set_status('cwkWritingToolKit', "Prefetching web dic: {done}/{total} ({cached} cached, {failed} failed)".format(
+            done=self.done, total=self.total, cached=self.cached, failed=self.failed))
+
+
 # cwk_fetch_web_dic text command inserts one of the synonym definitions fetched from the given web dictionary.
 # camel casing: CwkFetchWebDic
 # snake casing: cwk_fetch_web_dic
@@ -632,6 +4009,102 @@ class CwkFetchWebDic(sublime_plugin.TextCommand, cwkBase):
         self._fetcher_thread.start()
         self.log("web dic thread started")
 
+# cwk_prefetch_web_dic window command fills the web dictionary cache for the keywords or words of the current view or project.
+# Running it again while a prefetch is going on cancels that prefetch; running it once more resumes it.
+#     window.run_command("cwk_prefetch_web_dic", {"source": "keywords", "scope": "view"})
+
+
+class CwkPrefetchWebDic(sublime_plugin.WindowCommand, cwkBase):
+
+    _prefetch_thread = None
+
+    def __init__(self, window):
+        super().__init__(window)
+        cwkBase.__init__(self)
+
+    def run(self, source="keywords", scope="view"):
+        view = self.window.active_view()
+        running = CwkPrefetchWebDic._prefetch_thread
+        if running is not None and running.is_alive():
+            running.stop()
+            sublime.status_message("Cancelling web dic prefetch")
+            return
+        if not self.web_dic_cache:
+            sublime.status_message("Web dic prefetch needs web_dic_cache turned on")
+            return
+
+        if scope == "project":
+            texts = None
+            folders = self.window.folders()
+        else:
+            texts = [view.substr(sublime.Region(0, view.size()))]
+            folders = []
+        threading.Thread(target=self.startPrefetch, args=(source, texts, folders, view)).start()
+
+    def startPrefetch(self, source, texts, folders, view):
+        terms = self.collectTerms(source, texts, folders)
+        self.log("Prefetching {num} {source} from the {scope}".format(num=len(terms), source=source, scope="project" if folders else "view"))
+        thread = cwkWebDicPrefetchThread(terms, self.window, view)
+        CwkPrefetchWebDic._prefetch_thread = thread
+        thread.start()
+
+    def collectTerms(self, source, texts, folders):
+        """distinct keywords or words, most frequent first
+        """
+
+        tokenizer = cwkTokenizer()
+        counts = collections.Counter()
+
+        def count(fh):
+            for keywords, words in tokenizer.batches(fh):
+                counts.update(keywords if source == "keywords" else words)
+
+        for text in texts or []:
+            count(io.StringIO(text))
+        for filename in self.getCorpusFiles(folders):
+            if not self.isCorpusFile(filename):
+                continue
+            try:
+                with codecs.open(filename, "r", "utf-8") as fh:
+                    count(fh)
+            except (OSError, UnicodeDecodeError) as e:
+                self.log("Error reading {name}: {error}".format(name=filename, error=e))
+        return [term.strip() for term, _ in counts.most_common()]
+
+# cwk_show_metrics window command shows the counters, hit rates and timer percentiles in an output panel and writes
+# them to the metrics JSON file, or clears them with the reset action.
+# camel casing: CwkShowMetrics
+# snake casing: cwk_show_metrics
+# Sublime Text translates camel cased commands into snake cased ones.
+# You can run snake cased command by calling the window's run_command() method as the following:
+#     window.run_command("cwk_show_metrics", {"action": "reset"})
+
+
+class CwkShowMetrics(sublime_plugin.WindowCommand, cwkBase):
+    def __init__(self, window):
+        super().__init__(window)
+        cwkBase.__init__(self)
+
+    def run(self, action="show"):
+        metrics = cwkMetrics.instance()
+        if action == "reset":
+            metrics.reset()
+            sublime.status_message("cwkWritingToolKit metrics cleared")
+            return
+
+        try:
+            snapshot = metrics.dump()
+        except OSError as e:
+            self.log("Error writing metrics to {path}: {error}".format(path=metrics.metrics_file_path, error=e))
+            snapshot = metrics.snapshot()
+        lines = metrics.report(snapshot)
+        lines += ["", "Written to {path}".format(path=metrics.metrics_file_path)]
+
+        panel = self.window.create_output_panel("cwk_metrics")
+        panel.run_command("append", {"characters": "\n".join(lines) + "\n"})
+        self.window.run_command("show_panel", {"panel": "output.cwk_metrics"})
+
+
 # cwk_insert_selected_text command inserts text at cursor position
 # camel casing: CwkInsertSelectedText
 # snake casing: cwk_insert_selected_text
@@ -787,41 +4260,82 @@ class CwkFetchKeywords(sublime_plugin.WindowCommand, cwkCorpus):
         """selects only those words that match the current word
         """
 
-        # Python idiom: list comprehension
-        # discards the words not matching the current word and strip whitespaces at both ends
-        if os.path.isfile(self.keyword_file_path):
-            fh = codecs.open(self.keyword_file_path, "r", "utf-8")
-            self._normalizedWords = [w.strip() for w in fh.readlines() if self.currentWord in w]
+        # the keyword file of this window's folders is read once and searched in memory until the next build rewrites it
+        with cwkMetrics.instance().timer('keywords.lookup'):
+            store = cwkKeywordStore.open(self.keywordFilePath(self.window.folders()))
+            self._normalizedWords = store.matches(self.currentWord) if store is not None else []
 
-class CwkAutoComplete(cwkCorpus, cwkBase, sublime_plugin.EventListener):
+class CwkAutoComplete(cwkBase, sublime_plugin.EventListener):
 
-    _collector_thread = None
-    _window_id = None
-    _corpus_built = False
+    _registry = None
 
-    def buildCorpus(self):
+    @classmethod
+    def registry(cls):
+        """the corpus registry, shared with the commands that look words up in the corpora
+        """
 
-        window = sublime.active_window()
+        if cls._registry is None:
+            cls._registry = cwkCorpusRegistry()
+        return cls._registry
 
-        # corpus already built for this project
+    def buildCorpus(self, window=None):
+
+        window = window or sublime.active_window()
         settings = cwkBase()
-        if self._corpus_built and window.id() == self._window_id and not settings.force_rebuild_corpus_on_every_save: return
 
-        self._window_id = window.id()
-        view = window.active_view()
+        # every project folder set has its own corpus; a new one starts from its on-disk cache
 
-        self.clearCorpus()
-        self._corpus_built = True
+        open_folders = window.folders()
+        scheduler, created = self.registry().open(open_folders)
 
-        open_folders = view.window().folders()
-        cwkBase.log(self, "building corpus for window id {id}".format(id=self._window_id))
-        if self._collector_thread is not None:
-            self._collector_thread.stop()
-        self._collector_thread = cwkWordsCollectorThread(self, open_folders)
-        self._collector_thread.start()
+        # the watcher goes up before the build walks the folders; it rescans once its watches are in place
+
+        scheduler.watch(settings.watch_corpus_files)
+        if created:
+            cwkBase.log(self, "building corpus for {folders}".format(folders=open_folders))
+            scheduler.request(full=True, load_cache=True)
+
+        # corpus already built for this project
+
+        elif settings.force_rebuild_corpus_on_every_save:
+
+            # incremental mode keeps the corpus and only reparses files whose manifest entry changed
+
+            scheduler.request(full=not settings.incremental_corpus_rebuild)
+        return scheduler
 
     def on_post_save(self, view):
-        self.buildCorpus()
+        # inotify picks up saves in watched folders; indexing stays off the save path. A polling watcher would only
+        # see the save seconds later
+
+        window = view.window()
+        if window is None:
+            return
+        scheduler = self.registry().find(window.folders())
+        if scheduler is not None and scheduler.isWatchingEvents():
+            return
+        self.buildCorpus(window)
+
+    def on_selection_modified(self, view):
+        # moving off the word being read aloud cuts it short
+
+        speech = cwkSpeechQueue._instance
+        if speech is None or not speech.isBusy():
+            return
+        selection = view.sel()
+        if len(selection):
+            speech.cancelUnless(view.substr(view.word(selection[0].begin())))
+
+    def viewWords(self, view, prefix):
+        """words of the current view matching the prefix, used to favour terms already in use
+        """
+
+        if not self.rank_completions or not prefix:
+            return None
+        try:
+            return set(view.extract_completions(prefix))
+        except (AttributeError, TypeError):
+            return None
 
     def on_query_completions(self, view, prefix, locations):
         current_file = view.file_name()
@@ -831,6 +4345,14 @@ class CwkAutoComplete(cwkCorpus, cwkBase, sublime_plugin.EventListener):
         )
         completions = []
         if self.isCorpusFile(current_file):
-            return self.get_autocomplete_list(prefix)
+
+            # first completion request for this project: load the corpus lazily; switching back to a warm one is free
+
+            with cwkMetrics.instance().timer('completion.query'):
+                window = view.window()
+                scheduler = self.registry().find(window.folders())
+                if scheduler is None:
+                    scheduler = self.buildCorpus(window)
+                return scheduler.corpus.get_autocomplete_list(prefix, self.viewWords(view, prefix))
             completions.sort()
         return (completions, completion_flags)